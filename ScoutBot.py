@@ -7,48 +7,230 @@ import os
 from pytz import timezone
 import re
 import json
+import urllib
 import signal
 import sys
 import shelve
+import calendar
+from bisect import bisect_right
+from array import array
+import sqlite3
+import socket
+import select
+import errno
+import fcntl
+import cPickle as pickle
 import unicodedata
-import pypd
-import holidays
+import random
+import threading
+import multiprocessing
+import Queue
+from contextlib import contextmanager
+from urlparse import urljoin
+from collections import OrderedDict, deque
+from itertools import compress, izip
+import codecs
+from importlib import import_module
+import argparse
+
+
+# Stands in for a module until something is looked up on it, so each
+# entry point (the bot, or a one-line query) only imports the backends
+# it actually uses.  Submodules are imported on demand too, so
+# oauth2client.file works without importing it up front.
+class LazyModule(object):
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self):
+        if self._module is None:
+            object.__setattr__(self, '_module', import_module(self._name))
+        return self._module
+
+    def __getattr__(self, attr):
+        module = self._load()
+        try:
+            return getattr(module, attr)
+        except AttributeError:
+            return import_module('%s.%s' % (self._name, attr))
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+# pooled HTTP for everything that talks to the outside world
+requests = LazyModule('requests')
 
 # HelpScout API
-from helpscout import HelpScout
+helpscout = LazyModule('helpscout')
+helpscout_exceptions = LazyModule('helpscout.exceptions')
+
+# PagerDuty API
+pypd = LazyModule('pypd')
+
+# only needed once the support hours table is built
+holidays = LazyModule('holidays')
 
 # Google Calendar API modules
-import httplib2
-from apiclient import discovery
-import oauth2client
-from oauth2client import client
-from oauth2client import tools
+httplib2 = LazyModule('httplib2')
+discovery = LazyModule('apiclient.discovery')
+oauth2client = LazyModule('oauth2client')
 
 # slackbot stuff
-from slackclient import SlackClient
+slackclient = LazyModule('slackclient')
 
 CALENDAR_REFRESH_INTERVAL = timedelta(minutes=10)
 TZ = timezone('US/Pacific')
 
+# how often to scan HelpScout: the normal rate, the fastest we'll go
+# when a ticket is about to cross an alert threshold, and the slow
+# rates for an empty queue and for when support is closed
 HELPSCOUT_SCAN_INTERVAL = timedelta(minutes=1)
+HELPSCOUT_MIN_SCAN_INTERVAL = timedelta(seconds=15)
+HELPSCOUT_IDLE_SCAN_INTERVAL = timedelta(minutes=3)
+HELPSCOUT_CLOSED_SCAN_INTERVAL = timedelta(minutes=10)
 HELPSCOUT_TIMEOUT = 30
 
+# keep-alive pools: one per host, this many open connections per host
+# (enough for every Slack sender at once)
+HTTP_POOL_HOSTS = 10
+HTTP_POOL_MAXSIZE = 8
+HTTP_TIMEOUT = 30
+
+# how many Slack Web API calls to make at once, and how long one may
+# take before it's worth a line in the log
+SLACK_SENDERS = 6
+SLACK_SLOW_SEND = 2
+
+# RTM reconnects: the first retry comes after about SLACK_RECONNECT_MIN
+# seconds, doubling (with jitter) up to SLACK_RECONNECT_MAX; a
+# reconnect reuses the user and channel directories from the last full
+# rtm.start unless they're older than SLACK_DIRECTORY_MAX_AGE
+SLACK_RECONNECT_MIN = 0.5
+SLACK_RECONNECT_MAX = 60
+SLACK_DIRECTORY_MAX_AGE = timedelta(hours=6)
+
+# how often to ping the RTM websocket
+SLACK_PING_INTERVAL = 3
+
+# Chat commands that wait on the network run on a few background
+# threads: how many, how many may queue up behind them, how long before
+# the asker gets an "On it..." and how long each kind may take
+COMMAND_WORKERS = 4
+COMMAND_QUEUE_SIZE = 20
+COMMAND_ACK_AFTER = 2
+COMMAND_TIMEOUTS = dict(links=20, support=30, status=30, sla=30, joke=10)
+
+# how many HelpScout URLs to remember ETag/Last-Modified validators for
+CONDITIONAL_CACHE_SIZE = 2000
+
+# HelpScout's per-minute request budget (corrected from the response
+# headers, and shared by every process on one shared db), the share
+# of it that only interactive lookups may spend, and how many 429s in
+# a row we'll sit through before giving up
+HELPSCOUT_RATE_LIMIT = 200
+HELPSCOUT_INTERACTIVE_RESERVE = 0.2
+HELPSCOUT_MAX_RETRIES = 5
+
 CALENDAR_SCAN_INTERVAL = timedelta(minutes=5)
 
+# Who's on support is checked again just after the next shift boundary
+# the schedule shows (SHIFT_CHANGE_GRACE seconds after, so PagerDuty and
+# the calendar agree it's over), and at least every
+# SHIFT_RECONCILE_INTERVAL in case the schedule changed under us
+SHIFT_CHANGE_GRACE = 5
+SHIFT_RECONCILE_INTERVAL = timedelta(minutes=15)
+
+# ticket number => (id, subject, url) for answering "hs 1234"; tickets
+# that dropped out of the scan window are kept for TICKET_CACHE_TTL
+TICKET_CACHE_SIZE = 5000
+TICKET_CACHE_TTL = timedelta(hours=1)
+
+# full-text search over recent tickets: how many to keep, how long one
+# stays searchable after it leaves the scan window and how many
+# distinct words of each are indexed
+SEARCH_INDEX_SIZE = 2000
+SEARCH_INDEX_TTL = timedelta(days=7)
+SEARCH_MAX_TERMS = 1000
+SEARCH_RESULTS = 10
+
+# how long clients have been waiting, grouped for "helpscout status":
+# (under this many seconds, label), last one catches the rest
+WAIT_BUCKETS = [(60 * 60, 'under an hour'),
+                (4 * 60 * 60, '1-4 hours'),
+                (24 * 60 * 60, '4-24 hours'),
+                (None, 'over a day')]
+
+# how much of the last client message a ticket keeps
+BODY_DIGEST_LENGTH = 140
+
+# how many ticket numbers to look up per HelpScout search
+HELPSCOUT_LOOKUP_BATCH = 20
+
 ANNOYANCE_FREQUENCY = timedelta(minutes=10)
 
+# the alert ledger: how long an alert is remembered, and how many
+# alerts are recorded between prunes of the forgotten ones
+ALERT_LEDGER_KEEP = timedelta(days=30)
+ALERT_LEDGER_SLACK = 1000
+
+# kinds of alert, worst first, and how an alert digest heads each
+ALERT_SEVERITIES = ('yell', 'everyone', 'nobody', 'support')
+ALERT_DIGEST_HEADINGS = dict(
+    yell     = "Waiting far too long:",
+    everyone = "Waiting too long:",
+    nobody   = "Waiting, and I couldn't figure out who is on support:",
+    support  = "Waiting on you:")
+
+# state shared by every ScoutBot instance on this host, and the leader
+# lease in it: how long a lease lasts and how often the holder renews
+SHARED_DB = 'scoutbot.db'
+LEADER_LEASE_TTL = 15
+LEADER_RENEW_INTERVAL = 5
+
+# how old the running bot's ticket snapshot can be before a read-only
+# query scans HelpScout itself
+SNAPSHOT_MAX_AGE = timedelta(minutes=15)
+
+# multi-process mode: after an error the poller waits about
+# POLLER_RETRY_MIN seconds, doubling (with jitter) up to
+# POLLER_RETRY_MAX, and the responder restarts a poller that died at
+# most once every POLLER_RESTART_INTERVAL seconds
+POLLER_RETRY_MIN = 5
+POLLER_RETRY_MAX = 300
+POLLER_RESTART_INTERVAL = 10
+
+# per-scan ticket history for SLA reports: where it lives, how many
+# days of it to keep, and the name code everyone past the first 255
+# names shares
+SLA_HISTORY_DIR = 'sla'
+SLA_HISTORY_DAYS = 400
+SLA_OTHER = 255
+
 USE_PAGERDUTY = True
+PAGERDUTY_POLICY = 'ActionKit Support Requests'
+
+# how many years either side of this one the support hours table covers
+SUPPORT_HOURS_YEARS = 1
 
-# setup a holiday detection system - removing Columbus Day and adding
-# in the extra days around T-day, Christmas and New Years
-HOLIDAY = holidays.US(years=datetime.now().year)
-HOLIDAY.pop([d for (d, n) in HOLIDAY.items() if n == 'Columbus Day'][0])
-HOLIDAY.append({
-    [d for (d, n) in HOLIDAY.items() if n == 'Thanksgiving'][0] + timedelta(days=1): 'Day after Thanksgiving'})
-HOLIDAY.append({
-    [d for (d, n) in HOLIDAY.items() if n == 'Christmas Day'][0] - timedelta(days=1): 'Christmas Eve'})
-HOLIDAY.append({
-    [d for (d, n) in HOLIDAY.items() if n == "New Year's Day"][0] - timedelta(days=1): "New Year's Eve"})
+
+# our holidays - US holidays minus Columbus Day, plus the extra days
+# around T-day, Christmas and New Years
+def support_holidays(years):
+    days = set()
+    for year in years:
+        for day, name in holidays.US(years=year).items():
+            if name == 'Columbus Day':
+                continue
+            days.add(day)
+            if name == 'Thanksgiving':
+                days.add(day + timedelta(days=1))
+            elif name in ('Christmas Day', "New Year's Day"):
+                days.add(day - timedelta(days=1))
+    return days
+
+def epoch(dt):
+    return calendar.timegm(dt.utctimetuple())
 
 
 def translate_unicode(str):
@@ -146,8 +328,1374 @@ def _body_len_minus_sig(body):
     match = re.search(r'^(.*)---?\r?\n', body, re.S)
     return len(match.group(1))
     
+# One keep-alive connection pool shared by every upstream API we talk
+# to, so a scan costs one TLS handshake per host instead of one per
+# request.
+class HTTPPool:
+    def __init__(self, hosts=HTTP_POOL_HOSTS, maxsize=HTTP_POOL_MAXSIZE):
+        self.hosts = hosts
+        self.maxsize = maxsize
+        self.session = None
+        self._httplib2 = {}
+
+    # made on the first request, so a Google-only query never loads
+    # requests
+    def _session(self):
+        if self.session is None:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.hosts, pool_maxsize=self.maxsize)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+            self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        return self.session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        return self._session().request(method.upper(), url, **kwargs)
+
+    # the Google API client insists on an httplib2 object, so hand out
+    # one long-lived instance per name rather than a new one per call
+    def httplib2(self, name):
+        if name not in self._httplib2:
+            self._httplib2[name] = httplib2.Http(timeout=HTTP_TIMEOUT)
+        return self._httplib2[name]
+
+    # pypd has no session hook, so point its request method at the pool
+    def install_pypd(self):
+        pool = self
+        def _do_request(entity, method, *args, **kwargs):
+            return entity._handle_response(
+                pool.request(method, *args, **kwargs))
+        pypd.mixins.ClientMixin._do_request = _do_request
+
+
+# A requests-per-minute token bucket.  Background callers leave a
+# reserve untouched and step aside while an interactive caller is
+# waiting, so chat lookups don't queue up behind a scan.  This one
+# keeps its level in-process; SharedTokenBucket keeps it where every
+# ScoutBot process can draw on the same budget.
+class TokenBucket:
+    def __init__(self, per_minute=HELPSCOUT_RATE_LIMIT,
+                 reserve=HELPSCOUT_INTERACTIVE_RESERVE):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.reserve = reserve
+        self.updated = time()
+        self.paused_until = 0
+        self.interactive_waiting = 0
+        self.cond = threading.Condition()
+
+    # the level (tokens, updated, paused_until) is current inside this
+    @contextmanager
+    def _state(self):
+        yield
+
+    def _refill(self):
+        now = time()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def take(self, interactive=False):
+        with self.cond:
+            if interactive:
+                self.interactive_waiting += 1
+            try:
+                while True:
+                    floor = 1 if interactive else \
+                            1 + self.capacity * self.reserve
+                    with self._state():
+                        self._refill()
+                        wait = self.paused_until - time()
+                        ready = wait <= 0 and self.tokens >= floor and \
+                                (interactive or not self.interactive_waiting)
+                        if ready:
+                            self.tokens -= 1
+                    if ready:
+                        self.cond.notify_all()
+                        return
+                    if wait <= 0:
+                        wait = (floor - self.tokens) * 60 / self.capacity
+                    self.cond.wait(max(wait, 0.05))
+            finally:
+                if interactive:
+                    self.interactive_waiting -= 1
+
+    # trust the server's view of the budget over our own
+    def update(self, limit=None, remaining=None):
+        with self.cond:
+            with self._state():
+                self._refill()
+                if limit:
+                    self.capacity = float(limit)
+                if remaining is not None:
+                    self.tokens = min(self.tokens, float(remaining))
+
+    def pause(self, seconds):
+        with self.cond:
+            with self._state():
+                self.paused_until = max(self.paused_until, time() + seconds)
+
+
+# The stock HelpScout client calls requests.get() and friends directly,
+# which opens a new connection every time.  This sends everything
+# through an HTTPPool instead.  GETs are made conditional: the
+# validators and decoded body of each URL are kept, and a 304 hands
+# back the same decoded object without downloading or parsing it again.
+# Every request draws from a shared TokenBucket, and 429s are retried
+# after Retry-After (or a jittered exponential backoff).  Chat command
+# threads share the client with the scan, so the validator cache and
+# the token refresh each have a lock; requests themselves run outside
+# them.  These are mixed into the stock client by pooled_helpscout().
+class PooledHelpScoutMixin:
+    def __init__(self, app_id, app_secret, http, limiter=None, log=None,
+                 **kwargs):
+        helpscout.HelpScout.__init__(self, app_id, app_secret, **kwargs)
+        self.http = http
+        self.limiter = limiter or TokenBucket()
+        self.log = log
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.auth_lock = threading.Lock()
+        self.conditional_cache = OrderedDict()
+        self.not_modified_count = 0
+        self.rate_limited_count = 0
+
+    # mark requests made in this block (on this thread) as someone in
+    # chat waiting for an answer
+    @contextmanager
+    def interactive(self):
+        previous = getattr(self.local, 'interactive', False)
+        self.local.interactive = True
+        try:
+            yield
+        finally:
+            self.local.interactive = previous
+
+    def _request(self, method, url, **kwargs):
+        return self.http.request(method, url, **kwargs)
+
+    # returns decoded JSON (or None for 201/204), dealing with expired
+    # tokens and rate limits along the way.  With summarize, a GET
+    # returns summarize(decoded JSON) and only that is kept for the
+    # next 304, not the body.
+    def _fetch(self, method, url, data=None, summarize=None):
+        cached = None
+        if method == 'get':
+            with self.lock:
+                cached = self.conditional_cache.pop(url, None)
+        try:
+            return self._fetch_once(method, url, data, summarize, cached)
+        except:
+            # keep the validators for next time
+            if cached:
+                self._remember(url, cached)
+            raise
+
+    def _fetch_once(self, method, url, data, summarize, cached):
+        retries = 0
+        while True:
+            token = self.access_token
+            headers = self._authentication_headers()
+            if cached:
+                if cached['etag']:
+                    headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    headers['If-Modified-Since'] = cached['last_modified']
+
+            self.limiter.take(getattr(self.local, 'interactive', False))
+            r = self._request(method, url, headers=headers, json=data)
+            remaining = r.headers.get('X-RateLimit-Remaining-Minute')
+            self.limiter.update(r.headers.get('X-RateLimit-Limit-Minute'),
+                                int(remaining) if remaining else None)
+
+            if r.status_code == 304:
+                if cached:
+                    with self.lock:
+                        self.not_modified_count += 1
+                    self._remember(url, cached)
+                    return cached['body']
+                # a 304 with nothing of ours to fall back on; ask again
+                # without validators
+                retries += 1
+                if retries > HELPSCOUT_MAX_RETRIES:
+                    raise helpscout_exceptions.HelpScoutException(
+                        "Unexpected 304 from %s" % (url,))
+            elif r.status_code in (201, 204):
+                return None
+            elif r.ok:
+                body = r.json()
+                if summarize:
+                    body = summarize(body)
+                if method == 'get' and (r.headers.get('ETag') or
+                                        r.headers.get('Last-Modified')):
+                    self._remember(url, dict(
+                        etag=r.headers.get('ETag'),
+                        last_modified=r.headers.get('Last-Modified'),
+                        body=body))
+                return body
+            elif r.status_code == 401:
+                self._authenticate(stale=token)
+            elif r.status_code == 429:
+                retries += 1
+                if retries > HELPSCOUT_MAX_RETRIES:
+                    raise helpscout_exceptions.HelpScoutRateLimitExceededException()
+                self._backoff(r, retries)
+            else:
+                raise helpscout_exceptions.HelpScoutException(r.text)
+
+    def _backoff(self, response, retries):
+        with self.lock:
+            self.rate_limited_count += 1
+        wait = response.headers.get('Retry-After') or \
+               response.headers.get('X-RateLimit-Retry-After')
+        try:
+            wait = float(wait)
+        except (TypeError, ValueError):
+            wait = min(60, 2 ** retries) * random.uniform(0.5, 1)
+        if self.log:
+            self.log("*** HelpScout rate limit hit, backing off %.1fs" % wait)
+        self.limiter.pause(wait)
+
+    # GET endpoint, keeping only summarize(body) between scans
+    def summarized(self, endpoint, summarize):
+        if self.access_token is None:
+            self._authenticate()
+        return self._fetch('get', urljoin(self.base_url, endpoint),
+                           summarize=summarize)
+
+    # make the next GET of endpoint a full one
+    def forget(self, endpoint):
+        with self.lock:
+            self.conditional_cache.pop(urljoin(self.base_url, endpoint), None)
+
+    def _remember(self, url, entry):
+        with self.lock:
+            self.conditional_cache[url] = entry
+            while len(self.conditional_cache) > CONDITIONAL_CACHE_SIZE:
+                self.conditional_cache.popitem(last=False)
+
+    def hit_(self, endpoint, method, resource_id=None, data=None, params=None):
+        if self.access_token is None:
+            self._authenticate()
+        url = urljoin(self.base_url, endpoint)
+        if resource_id is not None:
+            url = urljoin(url + '/', str(resource_id))
+        if params:
+            if isinstance(params, dict):
+                params = '&'.join('%s=%s' % (k, v) for k, v in params.items())
+            url = '%s?%s' % (url, params)
+
+        response = self._fetch(method, url, data)
+        if response is None:
+            yield
+            return
+        for item in self._results_with_pagination(response, method):
+            yield item
+
+    def _results_with_pagination(self, response, method):
+        while True:
+            if '_embedded' not in response:
+                yield response
+                return
+            if isinstance(response['_embedded'], list):
+                for item in response['_embedded']:
+                    yield item
+            else:
+                yield response['_embedded']
+
+            next_page = (response.get('_links', {}).get('next') or {}).get('href')
+            if not next_page:
+                return
+            response = self._fetch(method, next_page)
+
+    # get a new token to replace stale (None for the first one), unless
+    # another thread already has while we waited for the lock
+    def _authenticate(self, stale=None):
+        with self.auth_lock:
+            if self.access_token != stale:
+                return
+            r = self._request('post', urljoin(self.base_url, 'oauth2/token'),
+                              data=dict(grant_type='client_credentials',
+                                        client_id=self.app_id,
+                                        client_secret=self.app_secret))
+            if not r.ok:
+                raise helpscout_exceptions.HelpScoutAuthenticationException(r.text)
+            self.access_token = r.json()['access_token']
+
+
+# the pooled client class is put together on first use, so helpscout
+# only gets imported by code that talks to HelpScout
+_pooled_helpscout_class = None
+
+def pooled_helpscout(app_id, app_secret, http, **kwargs):
+    global _pooled_helpscout_class
+    if _pooled_helpscout_class is None:
+        class PooledHelpScout(PooledHelpScoutMixin, helpscout.HelpScout):
+            pass
+        _pooled_helpscout_class = PooledHelpScout
+    return _pooled_helpscout_class(app_id, app_secret, http, **kwargs)
+
+
+# Stands in for slackclient's SlackRequest, which uses a bare urlopen()
+# per API call.
+class PooledSlackRequest(object):
+    def __init__(self, http):
+        self.http = http
+
+    def do(self, token, request="?", post_data={}, domain="slack.com"):
+        post_data = dict(post_data, token=token)
+        r = self.http.request('post', 'https://%s/api/%s' % (domain, request),
+                              data=post_data)
+        return SlackReply(r)
+
+class SlackError(Exception):
+    pass
+
+# Makes Slack Web API calls from a few threads, so posting to several
+# channels costs about one round-trip instead of one each.  Calls with
+# the same key (a channel, or the user a DM is for) run one at a time in
+# the order they were sent; different keys run side by side.  Each
+# finished call is reported back through finished(), for the main loop.
+class SlackSender:
+    def __init__(self, threads=SLACK_SENDERS, wake=None):
+        self.wake = wake
+        self.pending = dict()
+        self.ready = Queue.Queue()
+        self.done = Queue.Queue()
+        self.lock = threading.Lock()
+        for n in range(threads):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+
+    # on_error(exception) is called from finished() if call raises
+    def send(self, key, call, on_error=None):
+        with self.lock:
+            if key in self.pending:
+                self.pending[key].append((call, on_error))
+                return
+            self.pending[key] = deque([(call, on_error)])
+        self.ready.put(key)
+
+    # a worker owns a key until its queue runs dry
+    def _work(self):
+        while True:
+            key = self.ready.get()
+            while True:
+                with self.lock:
+                    if not self.pending[key]:
+                        del self.pending[key]
+                        break
+                    call, on_error = self.pending[key].popleft()
+                start = time()
+                try:
+                    call()
+                    error = None
+                except Exception, e:
+                    error = e
+                self.done.put((key, time() - start, error, on_error))
+                if self.wake:
+                    self.wake()
+
+    # (key, seconds, exception or None, on_error) for every call that
+    # finished since the last time
+    def finished(self):
+        results = []
+        while True:
+            try:
+                results.append(self.done.get_nowait())
+            except Queue.Empty:
+                return results
+
+# A bounded pool of threads for chat commands that wait on the network
+# (calendars, PagerDuty, HelpScout lookups, jokes), so they don't hold
+# up the RTM loop or the quick commands behind them.  Jobs are
+# [name, call, msg, submitted, deadline, state], where state is
+# 'waiting' (no "On it..." yet), 'acked', 'quiet' (never acknowledged)
+# or 'expired' (answered with an apology, result unwanted).  Finished
+# jobs come back through finished(), for the main loop to reply to.
+class CommandRunner:
+    def __init__(self, workers=COMMAND_WORKERS, size=COMMAND_QUEUE_SIZE,
+                 wake=None):
+        self.wake = wake
+        self.queue = Queue.Queue(size)
+        self.done = Queue.Queue()
+        self.pending = []
+        for n in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+
+    # False if too much is already waiting
+    def submit(self, name, call, msg, timeout, ack=True):
+        now = time()
+        job = [name, call, msg, now, now + timeout,
+               'waiting' if ack else 'quiet']
+        try:
+            self.queue.put_nowait(job)
+        except Queue.Full:
+            return False
+        self.pending.append(job)
+        return True
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                result, error = job[1](), None
+            except Exception, e:
+                result, error = None, e
+            self.done.put((job, result, error))
+            if self.wake:
+                self.wake()
+
+    # (job, result, exception or None) for every job that finished
+    # since the last time
+    def finished(self):
+        results = []
+        while True:
+            try:
+                job, result, error = self.done.get_nowait()
+            except Queue.Empty:
+                return results
+            if job in self.pending:
+                self.pending.remove(job)
+            results.append((job, result, error))
+
+    # the earliest "On it..." or timeout still to come
+    def next_deadline(self):
+        deadlines = [job[3] + COMMAND_ACK_AFTER if job[5] == 'waiting'
+                     else job[4] for job in self.pending
+                     if job[5] != 'expired']
+        return min(deadlines) if deadlines else None
+
+# just enough of a urlopen() result for slackclient
+class SlackReply(object):
+    def __init__(self, response):
+        self.code = response.status_code
+        self.body = response.content
+
+    def read(self):
+        return self.body
+
+# When support is open, as a sorted table of open intervals (epoch
+# seconds) covering this year and SUPPORT_HOURS_YEARS either side, built
+# from the open days, hours and holidays.  "Open at T?" and "next
+# opening after T" are each a binary search.  The table is built on
+# first use and rebuilt around the new year whenever a lookup lands in
+# its last year, so there's always a year of lookahead.
+class SupportHours:
+    def __init__(self, open_days, open_at, close_at,
+                 years=SUPPORT_HOURS_YEARS):
+        self.open_days = open_days
+        self.open_at = open_at.time()
+        self.close_at = close_at.time()
+        self.years = years
+        self.valid_from = self.valid_to = 0
+
+    def _build(self, year):
+        years = range(year - self.years, year + self.years + 1)
+        self.holidays = support_holidays(years)
+        self.opens = array('d')
+        self.closes = array('d')
+
+        day = datetime(years[0], 1, 1).date()
+        while day.year in years:
+            if day.weekday() in self.open_days and day not in self.holidays:
+                self.opens.append(epoch(TZ.localize(
+                    datetime.combine(day, self.open_at))))
+                self.closes.append(epoch(TZ.localize(
+                    datetime.combine(day, self.close_at))))
+            day += timedelta(days=1)
+
+        # before[i] is how long support had been open, in total, when
+        # interval i opened
+        self.before = array('d', [0])
+        for i in range(len(self.opens) - 1):
+            self.before.append(self.before[i] +
+                               self.closes[i] - self.opens[i])
+
+        self.valid_from = epoch(TZ.localize(datetime(years[0], 1, 1)))
+        self.valid_to = epoch(TZ.localize(datetime(years[-1], 1, 1)))
+
+    def _table(self, t):
+        if not self.valid_from <= t < self.valid_to:
+            self._build(datetime.fromtimestamp(t, TZ).year)
+
+    def is_open(self, t):
+        self._table(t)
+        i = bisect_right(self.opens, t) - 1
+        return i >= 0 and t < self.closes[i]
+
+    # the next time support opens at or after t (t itself if it's open
+    # now), or None if that's beyond the table
+    def next_open(self, t):
+        if self.is_open(t):
+            return t
+        i = bisect_right(self.opens, t)
+        return self.opens[i] if i < len(self.opens) else None
+
+    # seconds support has been open from the start of the table to t
+    def open_seconds(self, t):
+        i = bisect_right(self.opens, t) - 1
+        if i < 0:
+            return 0.0
+        return self.before[i] + min(t, self.closes[i]) - self.opens[i]
+
+    # Business-hours seconds from each of starts (epoch seconds, or None
+    # for "no wait") until now, as one array.  now is looked up once and
+    # each start is a single binary search, so a whole scan's worth of
+    # tickets is one pass.
+    def business_waits(self, starts, now):
+        self._table(now)
+        end = self.open_seconds(now)
+        waits = array('d', [0.0]) * len(starts)
+        for i, start in enumerate(starts):
+            if start is not None and start < now:
+                waits[i] = end - self.open_seconds(start)
+        return waits
+
+    def is_holiday(self, date):
+        self._table(epoch(TZ.localize(datetime.combine(date, self.open_at))))
+        return date in self.holidays
+
+# Per-scan ticket history, one row per (profile, ticket) per scan, kept
+# column by column: each day is a directory holding one flat array file
+# per column, appended to with array.tofile() and read back whole with
+# array.fromfile().  The profile and on-call columns are bytes indexing
+# a shared list of names.  Reports filter with bytes.translate() masks
+# and itertools.compress(), so most of the per-row work happens in C,
+# then boil the rows down to one per ticket before sorting.  A day a
+# crash left with uneven columns is cut to its shortest column.
+SLA_COLUMNS = (('at', 'I'), ('num', 'i'), ('profile', 'B'), ('state', 'B'),
+               ('wait', 'i'), ('oncall', 'B'), ('alert', 'B'))
+SLA_STATES = ('handled', 'new', 'needs_reply', 'snoozed', 'ignored')
+
+class SLAHistory:
+    def __init__(self, path=SLA_HISTORY_DIR, keep_days=SLA_HISTORY_DAYS):
+        self.path = path
+        self.keep_days = keep_days
+        self.labels = None
+        self.day = None
+
+    def _dir(self, day):
+        return os.path.join(self.path, day.isoformat())
+
+    def name(self, code):
+        if code == SLA_OTHER:
+            return 'other'
+        return self.labels[code] if code < len(self.labels) else '?'
+
+    def _load_labels(self):
+        self.labels = []
+        try:
+            with codecs.open(os.path.join(self.path, 'labels'),
+                             encoding='utf-8') as f:
+                self.labels = [line.rstrip('\n') for line in f]
+        except IOError:
+            pass
+
+    # byte code for a profile or person name; past 255 names everyone
+    # new shares SLA_OTHER.  With add=False an unknown name is None.
+    # Another process (a new leader, a restarted poller) may have added
+    # names since we last read the file, so an unknown name re-reads
+    # it, and a new code is only handed out under a lock on the file.
+    def label(self, name, add=True):
+        name = unicode(name or '')
+        if self.labels is None or name not in self.labels:
+            self._load_labels()
+        if name in self.labels:
+            return min(self.labels.index(name), SLA_OTHER)
+        if not add:
+            return None
+        with open(os.path.join(self.path, 'labels'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._load_labels()
+            if name in self.labels:
+                return min(self.labels.index(name), SLA_OTHER)
+            if len(self.labels) >= SLA_OTHER:
+                return SLA_OTHER
+            f.write((name + '\n').encode('utf-8'))
+        self.labels.append(name)
+        return len(self.labels) - 1
+
+    # rows are (num, profile, state, wait seconds, on-call, alert level)
+    def append(self, rows, at=None):
+        if not rows:
+            return
+        at = int(at or time())
+        day = datetime.fromtimestamp(at, TZ).date()
+        if day != self.day:
+            self._rotate(day)
+
+        columns = dict((name, array(code)) for name, code in SLA_COLUMNS)
+        for num, profile, state, wait, oncall, alert in rows:
+            columns['at'].append(at)
+            columns['num'].append(int(num))
+            columns['profile'].append(self.label(profile))
+            columns['state'].append(SLA_STATES.index(state))
+            columns['wait'].append(int(wait))
+            columns['oncall'].append(self.label(oncall))
+            columns['alert'].append(alert)
+
+        for name, code in SLA_COLUMNS:
+            with open(os.path.join(self._dir(day), name), 'ab') as f:
+                columns[name].tofile(f)
+
+    # start a new day's files and drop days past keep_days
+    def _rotate(self, day):
+        if not os.path.isdir(self._dir(day)):
+            os.makedirs(self._dir(day))
+        self.day = day
+        oldest = (day - timedelta(days=self.keep_days)).isoformat()
+        for name in os.listdir(self.path):
+            if re.match(r'\d{4}-\d\d-\d\d$', name) and name < oldest:
+                for column in os.listdir(os.path.join(self.path, name)):
+                    os.remove(os.path.join(self.path, name, column))
+                os.rmdir(os.path.join(self.path, name))
+
+    # every column for the last `days` days, as arrays
+    def load(self, days, now=None):
+        today = datetime.fromtimestamp(now or time(), TZ).date()
+        columns = dict((name, array(code)) for name, code in SLA_COLUMNS)
+        for offset in range(days - 1, -1, -1):
+            path = self._dir(today - timedelta(days=offset))
+            if not os.path.isdir(path):
+                continue
+            try:
+                rows = min(os.path.getsize(os.path.join(path, name)) //
+                           columns[name].itemsize
+                           for name, code in SLA_COLUMNS)
+            except OSError:
+                continue
+            for name, code in SLA_COLUMNS:
+                with open(os.path.join(path, name), 'rb') as f:
+                    columns[name].fromfile(f, rows)
+        self._load_labels()
+
+        # byte columns as bytearrays, ready for translate() masks
+        for name, code in SLA_COLUMNS:
+            if code == 'B':
+                columns[name] = bytearray(columns[name].tostring())
+        return columns
+
+# bytearray of 1s for the rows whose byte column holds one of codes
+def sla_mask(column, codes):
+    table = bytearray(256)
+    for code in codes:
+        if code is not None:
+            table[code] = 1
+    return column.translate(str(table))
+
+# keep only the rows whose byte column `name` holds one of codes, and
+# only the columns in keep (default all)
+def sla_filter(columns, name, codes, keep=None):
+    mask = sla_mask(columns[name], codes)
+    result = dict()
+    for key in keep or columns.keys():
+        selected = compress(columns[key], mask)
+        result[key] = bytearray(selected) if \
+                      isinstance(columns[key], bytearray) else list(selected)
+    return result
+
+# ticket number => its worst (largest) value among the rows, so a
+# ticket that sat through a hundred scans counts once
+def sla_worst(nums, values):
+    worst = dict()
+    get = worst.get
+    for num, value in izip(nums, values):
+        if value > get(num, -1):
+            worst[num] = value
+    return worst
+
+def sla_percentiles(values, fractions):
+    ordered = sorted(values)
+    return [ordered[min(len(ordered) - 1, int(f * len(ordered)))]
+            for f in fractions]
+
+# Every alert decision, one row per (profile, kind, ticket) in the
+# shared db, so the ANNOYANCE_FREQUENCY throttle and the "ticket was
+# opened" messages survive restarts and leader handovers instead of
+# re-alerting every overdue ticket at once.  Rows go through the same
+# fenced writes as the rest of memory; every ALERT_LEDGER_SLACK alerts
+# the ones older than ALERT_LEDGER_KEEP are dropped.
+class AlertLedger:
+    def __init__(self, memory):
+        self.memory = memory
+        self.sent = dict()
+        self.unpruned = 0
+
+    # re-read what has been sent, e.g. on taking over as leader
+    def load(self):
+        with self.memory.lock:
+            rows = self.memory.db.execute(
+                'SELECT profile, kind, num, at FROM alerts').fetchall()
+        self.sent = dict()
+        for profile, kind, num, at in rows:
+            self.sent[(profile, kind, num)] = \
+                datetime.strptime(at, '%Y-%m-%dT%H:%M:%S')
+        self.prune()
+
+    # when this kind of alert last went out about a ticket, or None
+    def last(self, profile, kind, num):
+        return self.sent.get((profile, kind, int(num)))
+
+    def record(self, profile, kind, num, at=None):
+        at = (at or datetime.utcnow()).replace(microsecond=0)
+        self.memory.write('INSERT OR REPLACE INTO alerts VALUES (?, ?, ?, ?)',
+                          (profile, kind, int(num), at.isoformat()))
+        self.sent[(profile, kind, int(num))] = at
+        self.unpruned += 1
+        if self.unpruned >= ALERT_LEDGER_SLACK:
+            self.prune()
+
+    def prune(self):
+        self.unpruned = 0
+        cutoff = datetime.utcnow() - ALERT_LEDGER_KEEP
+        if all(at >= cutoff for at in self.sent.values()):
+            return
+        self.memory.write('DELETE FROM alerts WHERE at < ?',
+                          (cutoff.replace(microsecond=0).isoformat(),))
+        self.sent = dict((key, at) for key, at in self.sent.items()
+                         if at >= cutoff)
+
+class NotLeader(Exception):
+    pass
+
+# Key/value store in SQLite that stands in for the old shelve file, so
+# several ScoutBot instances can share one memory.  Values are pickled
+# like shelve did.  Once an instance holds the leader lease its writes
+# are fenced: they only land while the lease still carries the token
+# it was handed, so a leader that stalled and lost the lease can't
+# clobber its successor.
+class SharedMemory:
+    def __init__(self, path=SHARED_DB, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                  check_same_thread=False)
+        self.fence = None
+        # readers never take the write lock, so queries can run
+        # alongside the bot and each other
+        if read_only:
+            return
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS memory '
+                        '(key TEXT PRIMARY KEY, value BLOB)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS lease '
+                        '(name TEXT PRIMARY KEY, holder TEXT, '
+                        ' token INTEGER, expires REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS bucket '
+                        '(name TEXT PRIMARY KEY, tokens REAL, updated REAL, '
+                        ' paused_until REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS alerts '
+                        '(profile TEXT, kind TEXT, num INTEGER, at TEXT, '
+                        ' PRIMARY KEY (profile, kind, num))')
+
+    def __getitem__(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM memory WHERE key = ?',
+                                  (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(str(row[0]))
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM memory WHERE key = ?',
+                                   (key,)).fetchone() is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        blob = sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self.write('INSERT OR REPLACE INTO memory VALUES (?, ?)', (key, blob))
+
+    # run one fenced write statement in its own transaction
+    def write(self, sql, args=()):
+        if self.read_only:
+            raise sqlite3.OperationalError("%s is open read-only" %
+                                           (self.path,))
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                if self.fence:
+                    row = self.db.execute(
+                        'SELECT token FROM lease WHERE name = ?',
+                        (self.fence[0],)).fetchone()
+                    if not row or row[0] != self.fence[1]:
+                        raise NotLeader("Lease %r has moved on from token %d" %
+                                        self.fence)
+                self.db.execute(sql, args)
+                self.db.execute('COMMIT')
+            except:
+                self.db.execute('ROLLBACK')
+                raise
+
+    # every write is already committed, nothing to flush
+    def sync(self):
+        pass
+
+    def close(self):
+        self.db.close()
+
+    # one-time copy of an old shelve memory.db
+    def import_shelf(self, path):
+        try:
+            old = shelve.open(path, 'r')
+        except Exception:
+            return
+        for key in old.keys():
+            try:
+                self[key] = old[key]
+            except Exception:
+                pass
+        old.close()
+
+# Lease-based leader election on top of SharedMemory.  The lease row
+# names its holder, when it expires and a fencing token that goes up
+# every time it changes hands.
+class LeaderLease:
+    def __init__(self, memory, name='scoutbot', ttl=LEADER_LEASE_TTL):
+        self.memory = memory
+        self.name = name
+        self.ttl = ttl
+        self.holder = '%s:%d:%04x' % (socket.gethostname(), os.getpid(),
+                                      random.getrandbits(16))
+        self.token = None
+        self.expires = 0
+
+    # take the lease if it's free or expired, or renew it if it's ours;
+    # returns True if we hold it afterwards
+    def acquire(self):
+        now = time()
+        db = self.memory.db
+        with self.memory.lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT holder, token, expires FROM lease '
+                                 'WHERE name = ?', (self.name,)).fetchone()
+                if row and row[0] != self.holder and row[2] > now:
+                    db.execute('COMMIT')
+                    self.token = None
+                    self.memory.fence = None
+                    return False
+
+                if row and row[0] == self.holder:
+                    token = row[1]
+                else:
+                    token = (row[1] if row else 0) + 1
+                db.execute('INSERT OR REPLACE INTO lease VALUES (?, ?, ?, ?)',
+                           (self.name, self.holder, token, now + self.ttl))
+                db.execute('COMMIT')
+            except:
+                db.execute('ROLLBACK')
+                raise
+
+        self.token = token
+        self.expires = now + self.ttl
+        self.memory.fence = (self.name, token)
+        return True
+
+    # do we still hold the lease, with a second to spare?
+    def held(self):
+        return self.token is not None and time() < self.expires - 1
+
+    # expire the lease rather than deleting it so the token keeps
+    # counting up for whoever takes it next
+    def release(self):
+        with self.memory.lock:
+            self.memory.db.execute('UPDATE lease SET expires = 0 WHERE '
+                                   'name = ? AND holder = ?',
+                                   (self.name, self.holder))
+        self.token = None
+        self.memory.fence = None
+
+# A TokenBucket whose level lives in SharedMemory, so the split poller
+# and responder and every replica on the shared db spend one HelpScout
+# budget between them instead of each getting the full rate.  Not
+# fenced: standbys and chat lookups spend from it too.
+class SharedTokenBucket(TokenBucket):
+    def __init__(self, memory, name='helpscout', **kwargs):
+        TokenBucket.__init__(self, **kwargs)
+        self.memory = memory
+        self.name = name
+
+    @contextmanager
+    def _state(self):
+        db = self.memory.db
+        with self.memory.lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT tokens, updated, paused_until '
+                                 'FROM bucket WHERE name = ?',
+                                 (self.name,)).fetchone()
+                if row:
+                    self.tokens, self.updated, self.paused_until = row
+                yield
+                db.execute('INSERT OR REPLACE INTO bucket VALUES (?, ?, ?, ?)',
+                           (self.name, self.tokens, self.updated,
+                            self.paused_until))
+                db.execute('COMMIT')
+            except:
+                db.execute('ROLLBACK')
+                raise
+
+# LRU of ticket number => (id, subject, url).  Every scan refreshes the
+# tickets it saw and pins them; anything else (looked up on demand, or
+# no longer in the scan window) expires after a TTL.
+class TicketCache:
+    def __init__(self, size=TICKET_CACHE_SIZE, ttl=TICKET_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.pinned = set()
+        self.lock = threading.Lock()
+
+    def get(self, num):
+        num = int(num)
+        with self.lock:
+            entry = self.entries.pop(num, None)
+            if entry is None:
+                return None
+            if entry[3] and entry[3] < datetime.utcnow():
+                return None
+            self.entries[num] = entry
+            return entry[:3]
+
+    def put(self, num, id, subject, url, pinned=False):
+        num = int(num)
+        expires = None if pinned else datetime.utcnow() + self.ttl
+        with self.lock:
+            self.entries.pop(num, None)
+            self.entries[num] = (id, subject, url, expires)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def update_scan(self, tickets):
+        seen = set()
+        for ticket in tickets:
+            self.put(ticket['num'], ticket['id'], ticket['subject'],
+                     ticket['url'], pinned=True)
+            seen.add(int(ticket['num']))
+
+        # start the clock on tickets that left the window
+        expires = datetime.utcnow() + self.ttl
+        with self.lock:
+            for num in self.pinned - seen:
+                if num in self.entries:
+                    self.entries[num] = self.entries[num][:3] + (expires,)
+            self.pinned = seen
+
+SEARCH_STOPWORDS = frozenset("""a an and are as at be but by can do for from
+    has have hi i if in is it me my no not of on or our please re so thanks
+    that the this to was we with you your""".split())
+
+# the distinct searchable words in text, in order, dropping markup and
+# stopwords
+def search_terms(text, limit=SEARCH_MAX_TERMS):
+    text = re.sub(r'<[^>]+>|&\w+;', ' ', text.lower())
+    terms = []
+    seen = set()
+    for word in re.findall(r'[a-z0-9]{2,}', text):
+        if word not in seen and word not in SEARCH_STOPWORDS:
+            seen.add(word)
+            terms.append(word)
+            if len(terms) >= limit:
+                break
+    return terms
+
+# An inverted index (word => ticket numbers) over the subjects and
+# thread bodies of recent tickets.  A ticket is only re-indexed when its
+# fingerprint (its thread ids) changes.  Tickets in the scan window
+# stay put; once one drops out it's kept for SEARCH_INDEX_TTL, and the
+# least recently indexed go first past SEARCH_INDEX_SIZE.
+class SearchIndex:
+    def __init__(self, size=SEARCH_INDEX_SIZE, ttl=SEARCH_INDEX_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.docs = OrderedDict()
+        self.postings = dict()
+        self.pinned = set()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def fresh(self, num, fingerprint):
+        with self.lock:
+            doc = self.docs.get(int(num))
+            return doc is not None and doc['fingerprint'] == fingerprint
+
+    def put(self, num, id, subject, url, fingerprint, terms):
+        num = int(num)
+        with self.lock:
+            self._remove(num)
+            self.docs[num] = dict(id=id, subject=subject, url=url,
+                                  fingerprint=fingerprint, terms=terms,
+                                  expires=None if num in self.pinned else
+                                  datetime.utcnow() + self.ttl)
+            for term in terms:
+                self.postings.setdefault(term, set()).add(num)
+            while len(self.docs) > self.size:
+                self._remove(next(iter(self.docs)))
+
+    def _remove(self, num):
+        doc = self.docs.pop(num, None)
+        if doc is None:
+            return
+        for term in doc['terms']:
+            nums = self.postings.get(term)
+            nums.discard(num)
+            if not nums:
+                del self.postings[term]
+
+    # pin this scan's tickets, start the clock on the ones that left and
+    # drop whatever has run out
+    def update_scan(self, tickets):
+        seen = set(int(t['num']) for t in tickets)
+        now = datetime.utcnow()
+        with self.lock:
+            for num in self.pinned - seen:
+                if num in self.docs:
+                    self.docs[num]['expires'] = now + self.ttl
+            for num in seen:
+                if num in self.docs:
+                    self.docs[num]['expires'] = None
+            self.pinned = seen
+            for num in [n for n, doc in self.docs.items()
+                        if doc['expires'] and doc['expires'] < now]:
+                self._remove(num)
+
+    # tickets containing every word in query, newest first, as
+    # (num, id, subject, url), plus how many matched in all
+    def search(self, query, limit=SEARCH_RESULTS):
+        terms = search_terms(query)
+        if not terms:
+            return [], 0
+        now = datetime.utcnow()
+        with self.lock:
+            postings = sorted((self.postings.get(t, set()) for t in terms),
+                              key=len)
+            nums = set(postings[0])
+            for more in postings[1:]:
+                nums &= more
+            docs = [(num, self.docs[num]) for num in nums
+                    if not (self.docs[num]['expires'] and
+                            self.docs[num]['expires'] < now)]
+        docs.sort(reverse=True)
+        return [(num, doc['id'], doc['subject'], doc['url'])
+                for num, doc in docs[:limit]], len(docs)
+
+# a short plain-text preview of a message body
+def body_digest(body, length=BODY_DIGEST_LENGTH):
+    text = ' '.join(re.sub(r'<[^>]+>|&\w+;', ' ', body or '').split())
+    return text if len(text) <= length else text[:length - 3] + '...'
+
+# One conversation as scans, alerts and status replies see it, from
+# either the active or the spam scan.  Slotted, and holding a digest
+# of the last client message rather than the text, so a day's worth
+# stays small.  It reads like the dicts it replaced (ticket['num'],
+# "...".format(**ticket)).
+class Ticket(object):
+    __slots__ = ('id', 'num', 'subject', 'url', 'folder_id', 'mailbox_id',
+                 'owner', 'created_at', 'new', 'needs_reply_or_close',
+                 'last_support_msg_at', 'last_client_msg_at', 'body_digest',
+                 'wait_time')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def keys(self):
+        return self.__slots__ + ('wait_time_human',)
+
+    def __getitem__(self, key):
+        if key == 'wait_time_human':
+            return td_format(self.wait_time or timedelta(0))
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+# "First Last" for a HelpScout assignee, or None if unassigned
+def owner_name(owner):
+    if not owner:
+        return None
+    if isinstance(owner, dict):
+        return ' '.join(n for n in (owner.get('first'), owner.get('last'))
+                        if n) or owner.get('email')
+    return unicode(owner)
+
+# The last scan's tickets, classified once and indexed by state, owner,
+# folder, mailbox and wait bucket, so status queries are set
+# intersections instead of walks over every ticket.  Rendered summaries
+# are kept until the tickets change, someone ignores or snoozes one, or
+# a snooze runs out.
+class TicketView:
+    def __init__(self, memory):
+        self.memory = memory
+        self.tickets = []
+        self.states = []
+        self.index = dict()
+        self.rendered = dict()
+        self.stale = True
+        self.refresh_at = None
+        # chat commands read it from the background command threads
+        self.lock = threading.RLock()
+
+    def update(self, tickets):
+        with self.lock:
+            self.tickets = list(tickets or [])
+            self.stale = True
+
+    # ignore/snooze lists changed
+    def invalidate(self):
+        with self.lock:
+            self.stale = True
+
+    # callers hold the lock
+    def _refresh(self):
+        if not self.stale and (self.refresh_at is None or
+                               datetime.utcnow() < self.refresh_at):
+            return
+
+        ignore_list = self.memory.get('ignore_list', set())
+        ignored_at  = self.memory.get('ignored_at', dict())
+        snooze      = self.memory.get('snooze', dict())
+        now = datetime.utcnow()
+
+        self.states = []
+        self.index = dict(state={}, owner={}, folder={}, mailbox={},
+                          bucket={})
+        self.refresh_at = None
+        for i, ticket in enumerate(self.tickets):
+            num = ticket['num']
+            if (num in ignore_list and
+                ignored_at[num] > ticket['last_client_msg_at']):
+                state = 'ignored'
+            elif int(num) in snooze and now < snooze[int(num)]:
+                state = 'snoozed'
+                self.refresh_at = min(self.refresh_at or snooze[int(num)],
+                                      snooze[int(num)])
+            elif ticket['new']:
+                state = 'new'
+            elif ticket['needs_reply_or_close']:
+                state = 'needs_reply'
+            else:
+                state = 'handled'
+            self.states.append(state)
+
+            bucket = None
+            if state in ('new', 'needs_reply'):
+                waited = ticket['wait_time'].total_seconds()
+                for limit, label in WAIT_BUCKETS:
+                    if limit is None or waited < limit:
+                        bucket = label
+                        break
+
+            for field, key in (('state', state),
+                               ('owner', ticket['owner']),
+                               ('folder', ticket['folder_id']),
+                               ('mailbox', ticket['mailbox_id']),
+                               ('bucket', bucket)):
+                self.index[field].setdefault(key, set()).add(i)
+
+        self.rendered = dict()
+        self.stale = False
+
+    def keys(self, field):
+        with self.lock:
+            self._refresh()
+            return [k for k in self.index[field] if k is not None]
+
+    # (ticket, state) pairs in scan order matching every criterion; a
+    # criterion can be one key or a collection of them (any will do),
+    # and None means don't care
+    def select(self, **criteria):
+        with self.lock:
+            self._refresh()
+            matches = None
+            for field, want in criteria.items():
+                if want is None:
+                    continue
+                if not isinstance(want, (set, frozenset, list, tuple)):
+                    want = [want]
+                found = set()
+                for key in want:
+                    found |= self.index[field].get(key, set())
+                matches = found if matches is None else matches & found
+            if matches is None:
+                matches = range(len(self.tickets))
+            return [(self.tickets[i], self.states[i])
+                    for i in sorted(matches)]
+
+    # the n tickets whose clients have waited longest
+    def oldest(self, n, **criteria):
+        waiting = self.select(state=('new', 'needs_reply'), **criteria)
+        waiting.sort(key=lambda pair: pair[0]['wait_time'], reverse=True)
+        return waiting[:n]
+
+    # build() is only called when nothing is cached under key
+    def render(self, key, build):
+        with self.lock:
+            self._refresh()
+            if key not in self.rendered:
+                self.rendered[key] = build()
+            return self.rendered[key]
+
+def _name_words(name):
+    return [w for w in re.split(r'\W+', (name or '').lower()) if w]
+
+# Slack users indexed under every form a calendar or PagerDuty name
+# might take: handle, full name, initials, first+last initials (so a
+# three-letter "jqd" handle still matches "John Doe") and first name.
+# Kept current from team_join/user_change events, and lookups are
+# memoized until the next change, so a repeat lookup is one dict probe.
+class SlackNameIndex:
+    def __init__(self, users=()):
+        self.forms = {}
+        self.user_forms = {}
+        self.handles = {}
+        self.memo = {}
+        for user in users:
+            self.set_user(user.id, user.name, user.real_name)
+
+    def __len__(self):
+        return len(self.user_forms)
+
+    def set_user(self, id, name, real_name, deleted=False):
+        self.remove_user(id)
+        if deleted:
+            return
+
+        forms = set()
+        self.handles[id] = name
+        handle = (name or '').lower()
+        if handle:
+            forms.add(('name', handle))
+            if len(handle) == 3 and handle.isalpha():
+                forms.add(('first_last', handle[0] + handle[2]))
+        words = _name_words(real_name)
+        if words:
+            forms.add(('name', ' '.join(words)))
+            forms.add(('first', words[0]))
+            forms.add(('initials', ''.join(w[0] for w in words)))
+            if len(words) > 1:
+                forms.add(('first_last', words[0][0] + words[-1][0]))
+
+        for form in forms:
+            self.forms.setdefault(form, set()).add(id)
+        self.user_forms[id] = forms
+        self.memo = {}
+
+    # a user object from a team_join or user_change event
+    def update(self, user):
+        self.set_user(user['id'], user.get('name'),
+                      user.get('real_name') or
+                      user.get('profile', {}).get('real_name'),
+                      deleted=user.get('deleted', False))
+
+    # the Slack handle for a user id, or None
+    def handle(self, id):
+        return self.handles.get(id)
+
+    def remove_user(self, id):
+        self.handles.pop(id, None)
+        for form in self.user_forms.pop(id, ()):
+            self.forms[form].discard(id)
+            if not self.forms[form]:
+                del self.forms[form]
+        self.memo = {}
+
+    # returns (user id, ()) for a match, (None, ids) when the first form
+    # that matches anyone matches several people, or (None, ())
+    def lookup(self, full_name):
+        if full_name in self.memo:
+            return self.memo[full_name]
+
+        result = (None, ())
+        words = _name_words(full_name)
+        if words:
+            initials = ''.join(w[0] for w in words)
+            probes = [('name', ' '.join(words)),
+                      ('name', words[0]),
+                      ('name', initials),
+                      ('initials', initials)]
+            # a single word has no last name, so "John" mustn't probe
+            # for "jj"
+            if len(words) > 1:
+                probes.append(('first_last', words[0][0] + words[-1][0]))
+            probes.append(('first', words[0]))
+            for probe in probes:
+                ids = self.forms.get(probe)
+                if ids:
+                    result = (list(ids)[0], ()) if len(ids) == 1 else \
+                             (None, tuple(sorted(ids)))
+                    break
+
+        self.memo[full_name] = result
+        return result
+
+# One team's view of HelpScout: which mailboxes it watches, how long
+# its tickets may wait, where to find who's on call and which channels
+# hear about it.  The [scoutbot] section is the "default" profile and
+# each [profile:NAME] section adds another, falling back to the
+# default's values for anything it leaves out.  Alert bookkeeping is
+# per profile so overlapping teams each get told.
+class Profile:
+    def __init__(self, name, mailboxes, max_wait_new_ticket,
+                 max_wait_response_or_close, pagerduty_policy,
+                 support_calendar_id, slack_channels):
+        self.name                       = name
+        self.mailboxes                  = mailboxes
+        self.max_wait_new_ticket        = max_wait_new_ticket
+        self.max_wait_response_or_close = max_wait_response_or_close
+        self.pagerduty_policy           = pagerduty_policy
+        self.support_calendar_id        = support_calendar_id
+        self.slack_channels             = slack_channels
+
+        # where the current on-call user is remembered between runs
+        self.support_user_key = 'support_user' if name == 'default' else \
+                                'support_user:' + name
+
+        self.current_tickets = None
+
+        # who shift_change() last saw on support, and when (epoch) it
+        # should look again; 0 means read it from memory first
+        self.shift_user = None
+        self.shift_check_at = 0
+
+    def watches(self, ticket):
+        return self.mailboxes is None or ticket['mailbox_id'] in self.mailboxes
+
+# A read-only ScoutBot (read_only=True) is for one-off queries: it
+# doesn't touch the shared memory db except to read it, has no leader
+# lease or SIGINT handler and only connects to the backends its query
+# needs.
 class ScoutBot:
-    def __init__(self, config_file='scoutbot.cfg'):
+    def __init__(self, config_file='scoutbot.cfg', read_only=False):
+        self.read_only = read_only
         config = SafeConfigParser()
         config.read([config_file, os.path.expanduser('~/.' + config_file)])
 
@@ -158,18 +1706,12 @@ class ScoutBot:
         self.hs_app_id                  = config.get('helpscout',
                                                      'app_id')
         self.helpscout_current_tickets  = None
-        self.last_helpscout_scan        = datetime.utcnow() - \
-                                          HELPSCOUT_SCAN_INTERVAL
+        self.next_helpscout_scan        = datetime.utcnow()
+        self.helpscout_scan_interval    = HELPSCOUT_SCAN_INTERVAL
         self.support_domain             = config.get('scoutbot',
                                                      'support_domain')
         self.other_support_people       = config.get('scoutbot',
                                                      'other_support_people').split(',')
-        self.max_wait_new_ticket        = int(config.get('scoutbot',
-                                                         'max_wait_new_ticket'))
-        self.max_wait_response_or_close = int(config.get('scoutbot',
-                                                         'max_wait_response_or_close'))
-        self.support_calendar_id        = config.get('scoutbot',
-                                                     'support_calendar_id')
         self.last_calender_scan        = datetime.utcnow() - \
                                          CALENDAR_SCAN_INTERVAL
         self.bugzilla_url              = config.get('bugzilla', 'url')
@@ -177,11 +1719,32 @@ class ScoutBot:
         self.slack_api_key              = config.get('slack', 'api_key')
         self.slack_bot_name             = config.get('slack', 'bot_name')
         self.slack_last_ping            = 0
+        self.sc                         = None
+        self.slack_wakeup               = None
+        self.slack_directory_at         = None
         self.slack_stack                = []
+        self.slack_sender               = None
+        self.commands                   = None
+        self.slack_dm_channels          = dict()
+        self.slack_sends                = 0
+        self.slack_send_failures        = 0
+        self.slack_send_seconds         = 0.0
         self.slack_connected            = False
+        self.slack_names                = SlackNameIndex()
+        self.slack_ambiguous_names      = set()
+
+        # set in multi-process mode, see slackbot_split()
+        self.poller                     = None
+        self.poller_is_leader           = False
+        self.outbox                     = None
+        self.poller_started_at          = 0
+        # DMs the poller has decided on but not yet handed over
+        self.dm_stack                   = []
+
+        self.http = HTTPPool()
 
         self.pagerduty_api_key = config.get('pagerduty','api_key')
-        pypd.api_key = self.pagerduty_api_key
+        self.pagerduty_ready = False
 
         self.support_open_at   = dateutil.parser.parse(
             config.get('scoutbot', 'support_open_at'))
@@ -192,24 +1755,64 @@ class ScoutBot:
             config.get('scoutbot', 'support_open_days'))
         self.support_open_days = support_open_days
 
-        channels = json.loads(config.get('slack', 'channels'))
-        self.slack_channels = channels
+        self.support_hours = SupportHours(self.support_open_days,
+                                          self.support_open_at,
+                                          self.support_close_at)
+
+        self.profiles = self._load_profiles(config)
+        self.default_profile = self.profiles[0]
+
+        # a reply from any team's support people counts as a support
+        # reply, so one parse of a conversation serves every profile
+        self.support_domains = set([self.support_domain])
+        for section in config.sections():
+            if (section.startswith('profile:') and
+                config.has_option(section, 'support_domain')):
+                self.support_domains.add(config.get(section, 'support_domain'))
+            if (section.startswith('profile:') and
+                config.has_option(section, 'other_support_people')):
+                self.other_support_people.extend(
+                    config.get(section, 'other_support_people').split(','))
+        self.support_domains = tuple(self.support_domains)
 
         if not (self.hs_app_secret and self.hs_app_id):
             raise Exception("Missing helpscout config value(s)!")
 
-        self.client = HelpScout(self.hs_app_id, self.hs_app_secret)
+        self.client = None if read_only else \
+                      pooled_helpscout(self.hs_app_id, self.hs_app_secret,
+                                       self.http, log=self.log)
 
-        self.calendar = []
-        self.calendar_refreshed_at = None
+        self.calendars = dict()
+        self.calendar_service = None
+        # chat commands refresh calendars from the command threads
+        self.calendar_lock = threading.RLock()
+        self.pd_policies = dict()
+
+        self.pending_alerts = OrderedDict()
 
-        self.last_alert_on_ticket = dict()
-        self.last_alert_everyone_on_ticket = dict()
         self.last_hs_link = dict()
         self.last_bugzilla_link = dict()
-        self.initial_alert_sent = set()
+        self.ticket_cache = TicketCache()
+        self.search_index = SearchIndex()
+        self.sla_history = SLAHistory(
+            config.get('scoutbot', 'sla_history') if
+            config.has_option('scoutbot', 'sla_history') else
+            SLA_HISTORY_DIR)
+        self.folder_ids = dict()
+
+        shared_db = config.get('scoutbot', 'shared_db') if \
+                    config.has_option('scoutbot', 'shared_db') else SHARED_DB
+        if read_only:
+            # nothing written yet means nothing to remember
+            self.memory = SharedMemory(shared_db, read_only=True) if \
+                          os.path.exists(shared_db) else dict()
+            self.ticket_view = TicketView(self.memory)
+            return
 
-        self.memory = shelve.open('memory.db')
+        self.memory = SharedMemory(shared_db)
+        self.client.limiter = SharedTokenBucket(self.memory)
+        if "quiet_users" not in self.memory:
+            self.memory.import_shelf('memory.db')
         if "quiet_users" not in self.memory:
             self.memory['quiet_users'] = set()
         if "ignore_list" not in self.memory:
@@ -222,59 +1825,208 @@ class ScoutBot:
             self.memory['snooze'] = dict()
         if "unsub" not in self.memory:
             self.memory['unsub'] = set()
-        if "support_user" not in self.memory:
-            self.memory['support_user'] = ""
+        for profile in self.profiles:
+            if profile.support_user_key not in self.memory:
+                self.memory[profile.support_user_key] = ""
+
+        self.ticket_view = TicketView(self.memory)
+        self.alert_ledger = AlertLedger(self.memory)
+        self.alert_ledger.load()
+        self.lease = LeaderLease(self.memory)
+        self.is_leader = False
+        self.lease_checked_at = 0
+        self.snapshot_at = None
 
         # is this too rude?  Maybe weird if ScoutBot gets used by
         # other code...
         def signal_handler(signal, frame):
             print("\nExiting SlackBot.  Thank you for playing.\n")
             self.memory.sync()
+            self.lease.release()
             sys.exit(0)
         signal.signal(signal.SIGINT, signal_handler)
 
-    def open_conversations(self, hours=24, status='active'):
+    def _load_profiles(self, config):
+        def profile(section, name, default=None):
+            def get(option, fallback):
+                if config.has_option(section, option):
+                    return config.get(section, option)
+                return fallback
+
+            mailboxes = get('mailboxes', None)
+            if mailboxes is not None:
+                mailboxes = set(int(m) for m in json.loads(mailboxes))
+            elif default:
+                mailboxes = default.mailboxes
+
+            # a profile that names its own calendar uses it, rather than
+            # the default's PagerDuty policy
+            if default:
+                policy = get('pagerduty_policy',
+                             None if config.has_option(
+                                 section, 'support_calendar_id')
+                             else default.pagerduty_policy)
+            else:
+                policy = get('pagerduty_policy',
+                             PAGERDUTY_POLICY if USE_PAGERDUTY else None)
+
+            if default:
+                channels = get('channels', None)
+                channels = json.loads(channels) if channels else \
+                           default.slack_channels
+            else:
+                channels = json.loads(config.get('slack', 'channels'))
+
+            return Profile(
+                name,
+                mailboxes,
+                int(get('max_wait_new_ticket',
+                        default and default.max_wait_new_ticket)),
+                int(get('max_wait_response_or_close',
+                        default and default.max_wait_response_or_close)),
+                policy,
+                get('support_calendar_id',
+                    default and default.support_calendar_id),
+                channels)
+
+        profiles = [profile('scoutbot', 'default')]
+        for section in config.sections():
+            if section.startswith('profile:'):
+                profiles.append(profile(section, section[len('profile:'):],
+                                        profiles[0]))
+        return profiles
+
+    # the mailboxes to ask HelpScout about, or None for all of them -
+    # profiles that overlap share one scan
+    def _scan_mailboxes(self):
+        mailboxes = set()
+        for profile in self.profiles:
+            if profile.mailboxes is None:
+                return None
+            mailboxes |= profile.mailboxes
+        return mailboxes
+
+    def profile_named(self, name):
+        for profile in self.profiles:
+            if profile.name == name:
+                return profile
+
+    # pick out a profile named in a chat message, if any
+    def _profile_for_text(self, text):
+        for profile in self.profiles[1:]:
+            if re.search(r'\b%s\b' % re.escape(profile.name), text, re.I):
+                return profile
+
+    # index=False keeps what's found out of search, e.g. spam
+    def open_conversations(self, hours=24, status='active', mailboxes=None,
+                           index=True):
         client = self.client
         results = []
+        # round down to the hour so the URL stays the same from one scan
+        # to the next and the conditional request can come back 304
         start_date = datetime.utcnow() - timedelta(hours = hours)
-        start_date = start_date.replace(microsecond=0).isoformat() + 'Z'
-        for conv in client.conversations.get(params=dict(status=status, modifiedSince=start_date)):
-            results.append(self.parse_conversation(conv))
+        start_date = start_date.replace(minute=0, second=0,
+                                        microsecond=0).isoformat() + 'Z'
+        params = dict(status=status, modifiedSince=start_date)
+        if mailboxes:
+            params['mailbox'] = ','.join(str(m) for m in sorted(mailboxes))
+        for conv in client.conversations.get(params=params):
+            self.renew_lease()
+            results.append(self.parse_conversation(conv, index=index))
+        self.set_wait_times(results)
         return results
 
-    def parse_conversation(self, conv):
+    # how long each ticket's client has been waiting, counting only the
+    # time support was open, all against the same clock reading
+    def set_wait_times(self, tickets, now=None):
+        now = time() if now is None else now
+        starts = [epoch(t['last_client_msg_at']) if t['last_client_msg_at']
+                  else None for t in tickets]
+        waits = self.support_hours.business_waits(starts, now)
+        for ticket, wait in zip(tickets, waits):
+            ticket['wait_time'] = timedelta(seconds=int(wait))
+
+    def parse_conversation(self, conv, index=True):
         client = self.client
-        data = dict(
-            owner      = getattr(conv, 'assignee', ''),
+        data = Ticket(
+            owner      = owner_name(getattr(conv, 'assignee', None)),
             id         = conv.id,
             num        = conv.number,
             subject    = conv.subject,
             folder_id  = conv.folderId,
+            mailbox_id = getattr(conv, 'mailboxId', None),
             url        = 'https://secure.helpscout.net/conversation/%s' % (conv.id,),
             created_at = dateutil.parser.parse(conv.createdAt).replace(tzinfo=None)
         )
 
-        # refetch to get thread info, needed to figure out last reply
-        threads = client.conversations[conv.id].threads.get()[0].threads
+        # refetch to get thread info, needed to figure out last reply.
+        # Only the summary outlives this call: an unchanged thread list
+        # comes back as a 304 and the summary from last time, so the
+        # full thread text is never kept around.  The summary notes
+        # whether the threads went into search, so a ticket that was
+        # scanned as spam gets indexed once it's let out.
+        def summarize(body):
+            threads = body.get('_embedded', {}).get('threads', [])
+            if index:
+                self.index_conversation(data, threads)
+            return index, self._summarize_threads(threads)
+        endpoint = 'conversations/%s/threads' % (conv.id,)
+        indexed, summary = client.summarized(endpoint, summarize)
+        if index and not indexed:
+            client.forget(endpoint)
+            indexed, summary = client.summarized(endpoint, summarize)
+        last_support_msg_at, last_client_msg_at, digest = summary
+
+        data['new'] = last_support_msg_at is None
+        data['last_support_msg_at'] = last_support_msg_at
+        data['last_client_msg_at'] = last_client_msg_at
+        data['body_digest'] = digest
+
+        if data['new']:
+            data['needs_reply_or_close'] = True
+        elif data['last_client_msg_at'] is None:
+            # we're talking to ourselves now, great
+            data['needs_reply_or_close'] = False
+        else:
+            data['needs_reply_or_close'] = last_client_msg_at > last_support_msg_at
+
+        return data
+
+    # add a conversation to the search index unless its threads are the
+    # ones already indexed; in multi-process mode the chat process gets
+    # a copy, since that's where searches are answered
+    def index_conversation(self, ticket, threads):
+        fingerprint = tuple(t.get('id') or t.get('createdAt')
+                            for t in threads)
+        if self.search_index.fresh(ticket['num'], fingerprint):
+            return
+        subject = translate_unicode(ticket['subject'] or '')
+        terms = search_terms(' '.join([subject] +
+                                      [t.get('body') or '' for t in threads]))
+        entry = (ticket['num'], ticket['id'], subject, ticket['url'],
+                 fingerprint, terms)
+        self.search_index.put(*entry)
+        if self.outbox:
+            self.outbox.send(('index',) + entry)
+
+    def _summarize_threads(self, threads):
         last_support_msg_at = None
         last_client_msg_at = None
         last_owner_email = None
-        first = True
-        last_body = None
+        last_digest = None
 
         for thread in threads:
             created_at = dateutil.parser.parse(thread['createdAt'])\
                          .replace(tzinfo=None)
 
             email = thread['createdBy']['email']
-            body = thread.get('body', '').lower()
-            last_body = body
+            body = (thread.get('body') or '').lower()
             
             # ignore drafts so we keep getting reminders
             if thread.get('state', '') == 'draft' or thread.get('type', '') == 'lineitem':
                 continue
             
-            if email.endswith(self.support_domain) or email in self.other_support_people:
+            if email.endswith(self.support_domains) or email in self.other_support_people:
                 if (last_support_msg_at is None or \
                     last_support_msg_at < created_at):
                     last_support_msg_at = created_at
@@ -290,161 +2042,505 @@ class ScoutBot:
                 if (last_client_msg_at is None or \
                     last_client_msg_at < created_at):
                     last_client_msg_at = created_at
+                    last_digest = body_digest(thread.get('body'))
 
-        data['new'] = last_support_msg_at is None
-        data['last_support_msg_at'] = last_support_msg_at
-        data['last_client_msg_at'] = last_client_msg_at
-        data['last_body'] = body
-
-        if data['new']:
-            data['needs_reply_or_close'] = True
-        elif data['last_client_msg_at'] is None:
-            # we're talking to ourselves now, great
-            data['needs_reply_or_close'] = False
-        else:
-            data['needs_reply_or_close'] = last_client_msg_at > last_support_msg_at
-
-        # if the last client contact came while support was closed and
-        # support is now open, rebase last_client_msg_at at support
-        # open time
-        last_msg_at = (data['last_client_msg_at'] if
-                       data['last_client_msg_at'] else
-                       datetime.utcnow()).replace(
-            tzinfo=timezone("UTC")).astimezone(tz=TZ)
-        support_start_at = datetime.now(tz=TZ).replace(
-            hour=self.support_open_at.hour,
-            minute=0,
-            second=0)
-
-        if (last_msg_at < support_start_at):
-            # ticket pre-dated the start of support, start the clock again
-            data['wait_time'] = datetime.now(tz=TZ) - support_start_at
-            if data['wait_time'].total_seconds() < 0:
-                data['wait_time'] = datetime.utcnow() - datetime.utcnow()
-
-            data['wait_time_human'] = td_format(data['wait_time'])
-
-            self.log("last msg at: %s, support started at: %s" % (last_msg_at, support_start_at))
-            self.log("Found ticket %s from before support started at (%d:00) - reseting wait time to %s" % (data['num'], self.support_open_at.hour, data['wait_time_human']))
-
-        else:
-            data['wait_time'] = datetime.utcnow() - (data['last_client_msg_at'] if data['last_client_msg_at'] else datetime.utcnow())
-            data['wait_time_human'] = td_format(data['wait_time'])
-        
-        return data
+        return last_support_msg_at, last_client_msg_at, last_digest
 
     def watch(self, once=False):
         while True:
+            if not once and not self.lead():
+                sleep(LEADER_RENEW_INTERVAL)
+                continue
             self.scan_conversations()
             self.shift_change()
+            self.schedule_next_scan()
+            self.save_snapshot()
             if once:
                 return
-            sleep(10)
+            # and wake for any shift boundary before the next scan
+            scan_at = time() + self.helpscout_scan_interval.total_seconds()
+            while time() < scan_at:
+                sleep(max(0, min(scan_at, self.next_shift_check()) - time()))
+                if time() >= self.next_shift_check():
+                    self.shift_change()
+
+    # Renew or try to take the leader lease every few seconds.  Only the
+    # leader scans, alerts and answers chat; a standby keeps its Slack
+    # connection, calendars and the leader's last ticket snapshot warm
+    # so it can take over as soon as the lease runs out.
+    def lead(self):
+        # the poller process holds the lease in multi-process mode
+        if self.poller:
+            return self.poller_is_leader
+
+        if time() - self.lease_checked_at < LEADER_RENEW_INTERVAL:
+            return self.is_leader and self.lease.held()
+        self.lease_checked_at = time()
+
+        was_leader = self.is_leader
+        self.is_leader = self.lease.acquire()
+        if self.is_leader and not was_leader:
+            self.log("*** Took over as leader (fencing token %d)" %
+                     (self.lease.token,))
+            # pick up whatever the last leader alerted on, and whoever
+            # it last saw on support
+            self.alert_ledger.load()
+            for profile in self.profiles:
+                profile.shift_check_at = 0
+            self.next_helpscout_scan = datetime.utcnow()
+        elif was_leader and not self.is_leader:
+            self.log("*** Lost the leader lease, standing by")
+            self.slack_stack = []
+            self.dm_stack = []
+
+        if not self.is_leader:
+            self.load_snapshot()
+        return self.is_leader
+
+    # after NotLeader: whatever was queued up as leader must not go out
+    def stand_down(self, e):
+        self.log("*** %s, standing by" % (e,))
+        self.is_leader = False
+        self.slack_stack = []
+        self.dm_stack = []
+
+    # A scan can outlast the lease (HELPSCOUT_TIMEOUT is longer than
+    # LEADER_LEASE_TTL), so the leader renews it as the scan goes and
+    # gives up the scan if someone else has taken over.
+    def renew_lease(self):
+        if self.read_only or not self.is_leader:
+            return
+        if time() - self.lease_checked_at < LEADER_RENEW_INTERVAL:
+            return
+        self.lease_checked_at = time()
+        if not self.lease.acquire():
+            raise NotLeader("Lost the leader lease mid-scan")
+
+    # only the lease holder hands anything to Slack; in multi-process
+    # mode the poller holds it and tells us whether it still does
+    def may_post(self):
+        if self.poller:
+            return self.poller_is_leader
+        return self.is_leader and self.lease.held()
+
+    def save_snapshot(self):
+        self.memory['helpscout_snapshot'] = dict(
+            at      = datetime.utcnow(),
+            tickets = self.helpscout_current_tickets)
+
+    def load_snapshot(self):
+        snapshot = self.memory.get('helpscout_snapshot')
+        if not snapshot or snapshot['at'] == self.snapshot_at:
+            return
+        self.snapshot_at = snapshot['at']
+        self.apply_snapshot(snapshot['tickets'])
 
+    def apply_snapshot(self, tickets):
+        self.helpscout_current_tickets = tickets
+        self.ticket_view.update(tickets)
+        self.ticket_cache.update_scan(tickets or [])
+        self.search_index.update_scan(tickets or [])
+        for profile in self.profiles:
+            profile.current_tickets = [t for t in (tickets or [])
+                                       if profile.watches(t)]
+
+    # pick when to scan next: slowly while support is closed or nothing
+    # is waiting, and right around the next alert threshold when a
+    # ticket is getting close to one
+    def schedule_next_scan(self):
+        interval = HELPSCOUT_SCAN_INTERVAL
+        reason = "normal"
+
+        if self._support_closed():
+            interval = HELPSCOUT_CLOSED_SCAN_INTERVAL
+            reason = "support closed"
+            opens = self.support_hours.next_open(time())
+            if opens and opens - time() < interval.total_seconds():
+                interval = max(timedelta(seconds=opens - time() + 1),
+                               HELPSCOUT_MIN_SCAN_INTERVAL)
+                reason = "support opening"
+        else:
+            waiting = [(profile, t) for profile in self.profiles
+                       for t in (profile.current_tickets or [])
+                       if t['new'] or t['needs_reply_or_close']]
+            if not waiting:
+                interval = HELPSCOUT_IDLE_SCAN_INTERVAL
+                reason = "queue empty"
+
+            for profile, ticket in waiting:
+                limit = profile.max_wait_new_ticket if ticket['new'] else \
+                        profile.max_wait_response_or_close
+                waited = ticket['wait_time'].total_seconds()
+                for threshold in (limit, limit * 2, limit * 3):
+                    if threshold > waited:
+                        until = timedelta(seconds=threshold - waited + 1)
+                        if until < interval:
+                            interval = max(until, HELPSCOUT_MIN_SCAN_INTERVAL)
+                            reason = "ticket %s nearing %s" % (
+                                ticket['num'], td_format(timedelta(
+                                    seconds=threshold)))
+                        break
+
+        self.helpscout_scan_interval = interval
+        self.next_helpscout_scan = datetime.utcnow() + interval
+        self.log("*** Next scan in %ds (%s)" % (interval.total_seconds(),
+                                                reason))
+
+    # only profiles whose shift may have changed cost a lookup
     def shift_change(self):
-        current = self.support_now(just_name=True)
-        previous = self.memory['support_user']
+        for profile in self.profiles:
+            if time() >= profile.shift_check_at:
+                self._shift_change(profile)
+
+    def next_shift_check(self):
+        return min(profile.shift_check_at for profile in self.profiles)
+
+    def _shift_change(self, profile):
+        current, until = self.on_call(profile)
+        previous = profile.shift_user if profile.shift_check_at else \
+                   self.memory[profile.support_user_key]
+
+        profile.shift_check_at = time() + \
+                                 SHIFT_RECONCILE_INTERVAL.total_seconds()
+        if until:
+            profile.shift_check_at = min(
+                profile.shift_check_at,
+                calendar.timegm(until.utctimetuple()) + SHIFT_CHANGE_GRACE)
+        profile.shift_user = current
 
         if current != previous:
-            self.memory['support_user'] = current
+            self.memory[profile.support_user_key] = current
             if current:
                 self.slackbot_direct_message(current,
                                              "Ahoy! You're now on support.")
                 self.slackbot_direct_message(current,
-                                             self.helpscout_status())
+                                             self.helpscout_status(profile))
             if previous:
                 self.slackbot_direct_message(
                     previous, "Great job - your support shift is over!")
              
-    def helpscout_status(self):
-        if not self.helpscout_current_tickets:
-            return "I didn't find any active tickets in HelpScout.  Most likely this means there aren't any, but it's also possible I'm having trouble communicating with HelpScout, so you might want to double check."
-
-        ignore_list = self.memory['ignore_list']
-        ignored_at  = self.memory['ignored_at']
-        snooze      = self.memory['snooze']
-
-        summary = ["Currently active tickets modified within 24 hours:"]
-        for ticket in self.helpscout_current_tickets:
-            if (ticket['num'] in ignore_list and
-                ignored_at[ticket['num']] > ticket['last_client_msg_at']):
-                summary.append("[<{url}|#{num}>] {subject} => *ignored*.".format(**ticket))
-                continue
-
-            if int(ticket['num']) in snooze and datetime.utcnow() < snooze[int(ticket['num'])]:
-                summary.append("[<{url}|#{num}>] {subject} => *snoozed* until {time}.".format(time=snooze[int(ticket['num'])], **ticket))
-                continue
-
-
-            if ticket['new']:
-                summary.append("[<{url}|#{num}>] {subject} => *new and unclaimed* {wait_time_human}.".format(**ticket))
-            elif ticket['needs_reply_or_close']:
-                summary.append("[<{url}|#{num}>] {subject} => *needs response or close* {wait_time_human}.".format(**ticket))
+    # tickets for a read-only query: the running bot's snapshot if it's
+    # recent enough, otherwise a scan of our own (which alerts nobody)
+    def query_tickets(self):
+        snapshot = self.memory.get('helpscout_snapshot')
+        if (snapshot and snapshot['tickets'] is not None and
+            datetime.utcnow() - snapshot['at'] < SNAPSHOT_MAX_AGE):
+            tickets = snapshot['tickets']
+        else:
+            if self.client is None:
+                self.client = pooled_helpscout(self.hs_app_id,
+                                               self.hs_app_secret,
+                                               self.http, log=self.log)
+            tickets = self.open_conversations(
+                mailboxes=self._scan_mailboxes())
+            for ticket in tickets:
+                ticket['subject'] = translate_unicode(ticket['subject'])
+        self.set_wait_times(tickets)
+        self.apply_snapshot(tickets)
+        return tickets
+
+    def helpscout_status(self, profile=None):
+        mailboxes = profile.mailboxes if profile else None
+
+        def build():
+            tickets = self.ticket_view.select(mailbox=mailboxes)
+            if not tickets:
+                return "I didn't find any active tickets in HelpScout.  Most likely this means there aren't any, but it's also possible I'm having trouble communicating with HelpScout, so you might want to double check."
+
+            summary = ["Currently active tickets modified within 24 hours:"]
+            summary.extend(self._status_lines(tickets))
+
+            waiting = []
+            for limit, label in WAIT_BUCKETS:
+                count = len(self.ticket_view.select(bucket=label,
+                                                    mailbox=mailboxes))
+                if count:
+                    waiting.append("%d %s" % (count, label))
+            if waiting:
+                summary.append("Waiting: %s." % (", ".join(waiting),))
+
+            return "\n".join(summary)
+
+        return self.ticket_view.render(
+            ('status', profile and profile.name), build)
+
+    # "status mine": tickets assigned to whoever asked
+    def helpscout_status_mine(self, user_id, profile=None):
+        mailboxes = profile.mailboxes if profile else None
+
+        def build():
+            owners = [owner for owner in self.ticket_view.keys('owner')
+                      if self.slack_names.lookup(owner)[0] == user_id]
+            tickets = self.ticket_view.select(owner=owners,
+                                              mailbox=mailboxes) \
+                      if owners else []
+            if not tickets:
+                return "I don't see any active tickets assigned to you."
+            return "\n".join(["Your active tickets:"] +
+                             self._status_lines(tickets))
+
+        return self.ticket_view.render(
+            ('mine', user_id, profile and profile.name), build)
+
+    # "oldest N": the tickets that have been waiting longest
+    def helpscout_oldest(self, n=5, profile=None):
+        mailboxes = profile.mailboxes if profile else None
+
+        def build():
+            tickets = self.ticket_view.oldest(n, mailbox=mailboxes)
+            if not tickets:
+                return "Nobody is waiting on us right now."
+            return "\n".join(["Longest waiting tickets:"] +
+                             self._status_lines(tickets))
+
+        return self.ticket_view.render(
+            ('oldest', n, profile and profile.name), build)
+
+    # "status folder X", by folder id or name
+    def helpscout_status_folder(self, folder, profile=None):
+        mailboxes = profile.mailboxes if profile else None
+        folder_id = int(folder) if folder.isdigit() else \
+                    self.folder_named(folder)
+        if folder_id is None:
+            return "I don't know a HelpScout folder called %s." % (folder,)
+
+        def build():
+            tickets = self.ticket_view.select(folder=folder_id,
+                                              mailbox=mailboxes)
+            if not tickets:
+                return "No active tickets in folder %s." % (folder,)
+            return "\n".join(["Active tickets in folder %s:" % (folder,)] +
+                             self._status_lines(tickets))
+
+        return self.ticket_view.render(
+            ('folder', folder_id, profile and profile.name), build)
+
+    # HelpScout folder id by name, looked up once for the mailboxes in
+    # the current scan
+    def folder_named(self, name):
+        name = name.lower()
+        if name not in self.folder_ids and self.client is not None:
+            try:
+                with self.client.interactive():
+                    for mailbox_id in self.ticket_view.keys('mailbox'):
+                        folders = self.client.mailboxes[mailbox_id]\
+                                      .folders.get()[0].folders
+                        for folder in folders:
+                            self.folder_ids[folder['name'].lower()] = \
+                                folder['id']
+            except helpscout_exceptions.HelpScoutException, e:
+                self.log("*** Couldn't list HelpScout folders: %r" % (e,))
+        return self.folder_ids.get(name)
+
+    def _status_lines(self, tickets):
+        snooze = None
+        lines = []
+        for ticket, state in tickets:
+            if state == 'ignored':
+                lines.append("[<{url}|#{num}>] {subject} => *ignored*.".format(**ticket))
+            elif state == 'snoozed':
+                if snooze is None:
+                    snooze = self.memory.get('snooze', dict())
+                lines.append("[<{url}|#{num}>] {subject} => *snoozed* until {time}.".format(time=snooze.get(int(ticket['num'])), **ticket))
+            elif state == 'new':
+                lines.append("[<{url}|#{num}>] {subject} => *new and unclaimed* {wait_time_human}.".format(**ticket))
+            elif state == 'needs_reply':
+                lines.append("[<{url}|#{num}>] {subject} => *needs response or close* {wait_time_human}.".format(**ticket))
             else:
-                summary.append("[<{url}|#{num}>] {subject} => *handled*.".format(**ticket))
-
-        if len(summary) == 1:
-            summary.append("None!")
-
-        return "\n".join(summary)
+                lines.append("[<{url}|#{num}>] {subject} => *handled*.".format(**ticket))
+        return lines
     
     def scan_conversations(self):
         self.log("*** Scanning for conversations...")
-        tickets = timeout(lambda: self.open_conversations(),
-                          timeout_duration=HELPSCOUT_TIMEOUT,
-                          default='TIMEOUT')
+        mailboxes = self._scan_mailboxes()
+        try:
+            tickets = timeout(lambda: self.open_conversations(
+                                  mailboxes=mailboxes),
+                              timeout_duration=HELPSCOUT_TIMEOUT,
+                              default='TIMEOUT')
+        except helpscout_exceptions.HelpScoutRateLimitExceededException:
+            self.log("*** Rate limited looking for conversations...")
+            return
         if tickets == 'TIMEOUT':
             self.log("*** Timed out looking for conversation...")
             return
         self.helpscout_current_tickets = tickets
+        self.ticket_view.update(tickets)
 
         for ticket in tickets:
             # unicode in ticket text really makes a mess of everything
             ticket['subject'] = translate_unicode(ticket['subject'])
-
+        self.ticket_cache.update_scan(tickets)
+        self.search_index.update_scan(tickets)
+
+        for profile in self.profiles:
+            profile.current_tickets = [t for t in tickets
+                                       if profile.watches(t)]
+            self.scan_profile(profile)
+        self.send_alert_digests()
+
+        self.record_sla()
+        self.scan_spam(mailboxes)
+
+    # 0 if a ticket isn't over its profile's limit, else how many times
+    # over (capped at 3, the yelling level)
+    def alert_level(self, ticket, profile):
+        limit = profile.max_wait_new_ticket if ticket['new'] else \
+                profile.max_wait_response_or_close
+        waited = ticket['wait_time'].total_seconds()
+        for level in (3, 2, 1):
+            if waited > limit * level:
+                return level
+        return 0
+
+    def record_sla(self):
+        rows = []
+        for profile in self.profiles:
+            oncall = self.memory.get(profile.support_user_key)
+            for ticket, state in self.ticket_view.select(
+                    mailbox=profile.mailboxes):
+                waiting = state in ('new', 'needs_reply')
+                rows.append((ticket['num'], profile.name, state,
+                             ticket['wait_time'].total_seconds()
+                             if waiting else 0,
+                             oncall,
+                             self.alert_level(ticket, profile)
+                             if waiting else 0))
+        try:
+            self.sla_history.append(rows)
+        except (IOError, OSError), e:
+            self.log("*** Couldn't record SLA history: %r" % (e,))
+
+    # "sla report N days": how long clients waited, and how many tickets
+    # went over each alert threshold, counting each ticket's longest wait
+    def sla_report(self, days=7, profile=None):
+        columns = self.sla_history.load(days)
+        if profile:
+            columns = sla_filter(columns, 'profile', [
+                self.sla_history.label(profile.name, add=False)],
+                keep=('num', 'state', 'wait', 'alert'))
+        if not columns['num']:
+            return "I don't have any SLA history for the last %d days yet." % (days,)
+
+        lines = ["SLA for the last %d days%s:" % (
+            days, " (%s)" % (profile.name,) if profile else "")]
+        for state, title in (('new', "New tickets"),
+                             ('needs_reply', "Waiting on a reply")):
+            rows = sla_filter(columns, 'state', [SLA_STATES.index(state)],
+                              keep=('num', 'wait'))
+            waits = sla_worst(rows['num'], rows['wait']).values()
+            if not waits:
+                continue
+            lines.append("%s: %d tickets, waits p50 %s, p90 %s, p99 %s." % (
+                (title, len(waits)) +
+                tuple(td_format(timedelta(seconds=wait)) for wait in
+                      sla_percentiles(waits, (0.5, 0.9, 0.99)))))
+
+        over = sla_filter(columns, 'alert', (1, 2, 3), keep=('num', 'alert'))
+        alerts = sla_worst(over['num'], over['alert']).values()
+        breaches = tuple(len([a for a in alerts if a >= level])
+                         for level in (1, 2, 3))
+        lines.append("Over the limit: %d tickets, %d at twice the limit, "
+                     "%d at three times." % breaches)
+        return "\n".join(lines)
+
+    # "sla by person": the same, split by who was on support
+    def sla_by_person(self, days=7, profile=None):
+        columns = self.sla_history.load(days)
+        if profile:
+            columns = sla_filter(columns, 'profile', [
+                self.sla_history.label(profile.name, add=False)],
+                keep=('num', 'state', 'wait', 'oncall', 'alert'))
+        waiting = [SLA_STATES.index('new'), SLA_STATES.index('needs_reply')]
+        columns = sla_filter(columns, 'state', waiting,
+                             keep=('num', 'wait', 'oncall', 'alert'))
+        if not columns['num']:
+            return "I don't have any SLA history for the last %d days yet." % (days,)
+
+        lines = ["SLA by who was on support, last %d days%s:" % (
+            days, " (%s)" % (profile.name,) if profile else "")]
+        # one pass for everyone, keyed by (on-call code, ticket)
+        worst = sla_worst(izip(columns['oncall'], columns['num']),
+                          columns['wait'])
+        over = set(compress(izip(columns['oncall'], columns['num']),
+                            columns['alert']))
+        by_code = dict()
+        for (code, num), wait in worst.iteritems():
+            by_code.setdefault(code, []).append(wait)
+        for code in sorted(by_code):
+            waits = by_code[code]
+            lines.append("%s: %d tickets, p90 wait %s, %d over the limit." % (
+                self.plain_name(self.sla_history.name(code)) or "nobody",
+                len(waits),
+                td_format(timedelta(seconds=sla_percentiles(waits, (0.9,))[0])),
+                len([key for key in over if key[0] == code])))
+        return "\n".join(lines)
+
+    # "alice" for "<@U123>", so a report can name people without
+    # pinging them; anything else comes back as it was
+    def plain_name(self, user):
+        match = re.match(r'<@(\w+)>$', user or '')
+        if not match:
+            return user
+        return self.slack_names.handle(match.group(1)) or match.group(1)
+
+    def scan_profile(self, profile):
+        if len(self.profiles) > 1:
+            self.log("*** Checking tickets for %s..." % (profile.name,))
+
+        self.renew_lease()
+        for ticket in profile.current_tickets:
             if ticket['new']:
                 self.log("*** [%s] %s => new and unclaimed %s" % \
                          (ticket['num'],
                           ticket['subject'],
                           ticket['wait_time_human']))
 
-                user =  self.support_now(just_name=True)
-                user_id = self.slack_user_names.get(user.lower() if user else None, 0)
+                user =  self.support_now(just_name=True, profile=profile)
+                user_id = re.sub(r'[\<\>@]+', '', user) if user else None
 
-                if user and not self._support_closed() and ticket['num'] not in self.initial_alert_sent and user_id not in self.memory['quiet_users']:
+                if user and not self._support_closed() and not self.alert_ledger.last(profile.name, 'opened', ticket['num']) and user_id not in self.memory['quiet_users']:
                         self.slackbot_direct_message(user, "Ticket [<{url}|#{num}>] {subject} was opened.\nRespond 'quieter' to stop these messages (then 'louder' if you want them resumed).  Respond 'help' to see more options.".format(**ticket))
-                        alerts = self.initial_alert_sent.add(ticket['num'])
+                        self.alert_ledger.record(profile.name, 'opened',
+                                                 ticket['num'])
                         return
 
-                if ticket['wait_time'].total_seconds() > self.max_wait_new_ticket:
-                    self.alert_support(ticket)
+                if ticket['wait_time'].total_seconds() > profile.max_wait_new_ticket:
+                    self.alert_support(ticket, profile)
 
-                if ticket['wait_time'].total_seconds() > (self.max_wait_new_ticket * 3):
-                    self.alert_everyone(ticket, yell=True)
-                elif ticket['wait_time'].total_seconds() > (self.max_wait_new_ticket * 2):
-                    self.alert_everyone(ticket)
+                if ticket['wait_time'].total_seconds() > (profile.max_wait_new_ticket * 3):
+                    self.alert_everyone(ticket, profile, yell=True)
+                elif ticket['wait_time'].total_seconds() > (profile.max_wait_new_ticket * 2):
+                    self.alert_everyone(ticket, profile)
 
             elif ticket['needs_reply_or_close']:
                 self.log("*** [%s] %s => needs response or close %s" % \
                          (ticket['num'],
                           ticket['subject'],
                           ticket['wait_time_human']))
-                if ticket['wait_time'].total_seconds() > self.max_wait_response_or_close:
-                    self.alert_support(ticket)
-                if ticket['wait_time'].total_seconds() > (self.max_wait_response_or_close * 3):
-                    self.alert_everyone(ticket, yell=True)
-                elif ticket['wait_time'].total_seconds() > (self.max_wait_response_or_close * 2):
-                    self.alert_everyone(ticket)
+                if ticket['wait_time'].total_seconds() > profile.max_wait_response_or_close:
+                    self.alert_support(ticket, profile)
+                if ticket['wait_time'].total_seconds() > (profile.max_wait_response_or_close * 3):
+                    self.alert_everyone(ticket, profile, yell=True)
+                elif ticket['wait_time'].total_seconds() > (profile.max_wait_response_or_close * 2):
+                    self.alert_everyone(ticket, profile)
 
             else:
                 self.log("+ [%s] %s => handled" % \
                          (ticket['num'],
                           ticket['subject']))
 
+    def scan_spam(self, mailboxes=None):
         self.log("*** Scanning for spam...")
-        spam_tickets = timeout(lambda: self.open_conversations(status='spam'),
-                               timeout_duration=HELPSCOUT_TIMEOUT,
-                               default='TIMEOUT')
+        try:
+            spam_tickets = timeout(lambda: self.open_conversations(
+                                       status='spam', mailboxes=mailboxes,
+                                       index=False),
+                                   timeout_duration=HELPSCOUT_TIMEOUT,
+                                   default='TIMEOUT')
+        except helpscout_exceptions.HelpScoutRateLimitExceededException:
+            self.log("*** Rate limited looking for spam...")
+            return
         if spam_tickets == 'TIMEOUT':
             self.log("*** Timed out looking for spam...")
             return
@@ -460,27 +2556,27 @@ class ScoutBot:
                          (ticket['num'],
                           ticket['subject']))
 
-            user =  self.support_now(just_name=True)
-            if user and not self._support_closed():
-                self.slackbot_direct_message(user, "New spam ticket [<{url}|#{num}>] {subject} - please check if subject not obviously spammy.".format(**ticket))
-                self.slackbot_broadcast("New spam ticket [<{url}|#{num}>] {subject} - please check if subject not obviously spammy.".format(**ticket))
+            # profiles can share people and channels; tell each once
+            told = set()
+            for profile in self.profiles:
+                if not profile.watches(ticket):
+                    continue
+                user =  self.support_now(just_name=True, profile=profile)
+                if user and not self._support_closed():
+                    msg = "New spam ticket [<{url}|#{num}>] {subject} - please check if subject not obviously spammy.".format(**ticket)
+                    if user not in told:
+                        told.add(user)
+                        self.slackbot_direct_message(user, msg)
+                    for channel in profile.slack_channels:
+                        if channel not in told:
+                            told.add(channel)
+                            self.slack_stack.append((channel, msg))
 
 
     def _support_closed(self):
-        now = datetime.now(tz=TZ)
-        if now.weekday() not in self.support_open_days:
-            return True
-
-        if now.date() in HOLIDAY:
-            return True
-
-        if (now.hour >= self.support_open_at.hour and
-            now.hour < self.support_close_at.hour):
-            return False
-        
-        return True
+        return not self.support_hours.is_open(time())
                 
-    def alert_support(self, ticket):
+    def alert_support(self, ticket, profile):
         if self._support_closed():
             self.log("Ignoring [<{url}|#{num}>] for now, support is closed.".format(**ticket))
             return
@@ -496,23 +2592,24 @@ class ScoutBot:
             self.log("Ignoring [<{url}|#{num}>], it's snoozed until {time}.".format(time=snooze[int(ticket['num'])], **ticket))
             return
 
-        user =  self.support_now(just_name=True)
+        user =  self.support_now(just_name=True, profile=profile)
         if user:
             # don't alert too often on any given issue
-            if ticket['num'] in self.last_alert_on_ticket:
-                if ((datetime.utcnow() - self.last_alert_on_ticket[ticket['num']])
-                    < ANNOYANCE_FREQUENCY):
-                    return 
+            last = self.alert_ledger.last(profile.name, 'support',
+                                          ticket['num'])
+            if last and datetime.utcnow() - last < ANNOYANCE_FREQUENCY:
+                return
 
             self.log("+++ CALLING FOR HELP ON %s FROM %s +++" % (ticket['num'], user))
-            self.slackbot_direct_message(user, "Ticket [<{url}|#{num}>] {subject} has been awaiting a response for {wait_time_human}.\nRespond 'ignore {num}' and I will ignore this ticket from now on, or 'snooze {num} [n]' to snooze for n minutes, 10 by default.  Respond 'help' to see more options.".format(**ticket))
-            
+            self.queue_alert(('dm', user), 'support', ticket, "Ticket [<{url}|#{num}>] {subject} has been awaiting a response for {wait_time_human}.\nRespond 'ignore {num}' and I will ignore this ticket from now on, or 'snooze {num} [n]' to snooze for n minutes, 10 by default.  Respond 'help' to see more options.".format(**ticket))
+
         else:
-            self.slackbot_broadcast("Ticket [<{url}|#{num}>] {subject} has been awaiting a response for {wait_time_human} and I couldn't figure out who is on support!\n(Tell me 'ignore {num}' to ignore it or 'snooze {num} [n]' to snooze for n minutes, 10 by default.)".format(**ticket))
+            for channel in profile.slack_channels:
+                self.queue_alert(('channel', channel), 'nobody', ticket, "Ticket [<{url}|#{num}>] {subject} has been awaiting a response for {wait_time_human} and I couldn't figure out who is on support!\n(Tell me 'ignore {num}' to ignore it or 'snooze {num} [n]' to snooze for n minutes, 10 by default.)".format(**ticket))
 
-        self.last_alert_on_ticket[ticket['num']] = datetime.utcnow()
+        self.alert_ledger.record(profile.name, 'support', ticket['num'])
 
-    def alert_everyone(self, ticket, yell=False):
+    def alert_everyone(self, ticket, profile, yell=False):
         if self._support_closed():
             self.log("Ignoring [<{url}|#{num}>] for now, support is closed.".format(**ticket))
             return
@@ -529,55 +2626,121 @@ class ScoutBot:
             return
 
         # don't alert too often on any given issue
-        if ticket['num'] in self.last_alert_everyone_on_ticket:
-            if ((datetime.utcnow() - self.last_alert_everyone_on_ticket[ticket['num']]) < ANNOYANCE_FREQUENCY):
-                return 
+        last = self.alert_ledger.last(profile.name, 'everyone', ticket['num'])
+        if last and datetime.utcnow() - last < ANNOYANCE_FREQUENCY:
+            return
 
         # has it been a really long time?  Add in <!channel> for extra BOOM
         extra = "<!channel> " if yell else ""
-        self.slackbot_broadcast("{extra}Ticket [<{url}|#{num}>] {subject} has been awaiting a response for {wait_time_human}!\n(Tell me 'ignore {num}' to ignore it or 'snooze {num} [n]' to snooze for n minutes, 10 by default.)".format(extra=extra, **ticket))
-
-        self.last_alert_everyone_on_ticket[ticket['num']] = datetime.utcnow()
+        for channel in profile.slack_channels:
+            self.queue_alert(('channel', channel), 'yell' if yell else 'everyone', ticket, "{extra}Ticket [<{url}|#{num}>] {subject} has been awaiting a response for {wait_time_human}!\n(Tell me 'ignore {num}' to ignore it or 'snooze {num} [n]' to snooze for n minutes, 10 by default.)".format(extra=extra, **ticket))
+
+        self.alert_ledger.record(profile.name, 'everyone', ticket['num'])
+
+    # Alerts wait here until the end of the scan, keyed by recipient
+    # (('dm', user) or ('channel', name)) and then ticket number, so a
+    # recipient gets one message per scan however many tickets are over.
+    def queue_alert(self, recipient, severity, ticket, msg):
+        pending = self.pending_alerts.setdefault(recipient, OrderedDict())
+        # one line per ticket, at its worst severity
+        if (ticket['num'] in pending and
+            ALERT_SEVERITIES.index(pending[ticket['num']][0]) <
+            ALERT_SEVERITIES.index(severity)):
+            return
+        pending[ticket['num']] = (severity, ticket, msg)
+
+    def send_alert_digests(self):
+        pending, self.pending_alerts = self.pending_alerts, OrderedDict()
+        for (kind, to), alerts in pending.items():
+            alerts = alerts.values()
+            if len(alerts) == 1:
+                msg = alerts[0][2]
+            else:
+                msg = self.alert_digest(kind, alerts)
+            if kind == 'dm':
+                self.slackbot_direct_message(to, msg)
+            else:
+                self.slack_stack.append((to, msg))
+
+    def alert_digest(self, kind, alerts):
+        lines = []
+        # <!channel> once, at the top, if any of them is that bad
+        if any(severity == 'yell' for severity, ticket, msg in alerts):
+            lines.append("<!channel> %d tickets need a response!" % (
+                len(alerts),))
+        else:
+            lines.append("%d tickets need a response:" % (len(alerts),))
+        for severity in ALERT_SEVERITIES:
+            group = [ticket for s, ticket, msg in alerts if s == severity]
+            if not group:
+                continue
+            lines.append(ALERT_DIGEST_HEADINGS[severity])
+            for ticket in group:
+                lines.append("- [<{url}|#{num}>] {subject}, waiting "
+                             "{wait_time_human}".format(**ticket))
+        if kind == 'dm':
+            lines.append("Respond 'ignore N' and I will ignore ticket N from now on, or 'snooze N [n]' to snooze it for n minutes, 10 by default.  Respond 'help' to see more options.")
+        else:
+            lines.append("(Tell me 'ignore N' to ignore ticket N or 'snooze N [n]' to snooze it for n minutes, 10 by default.)")
+        return "\n".join(lines)
 
     def log(self, msg):
         print "%s: %s" % (datetime.now(), msg)
 
-    def support_now(self, just_name=False):
-        if USE_PAGERDUTY:
-            if not hasattr(self, 'pd_policy'):
-                self.pd_policy = pypd.EscalationPolicy.find_one(
-                    name='ActionKit Support Requests')
-            on_call = pypd.OnCall.find_one(
-                escalation_policy_ids=[self.pd_policy.id])
+    # point pypd at our key and HTTP pool the first time it's needed, so
+    # calendar-only lookups never import it
+    def pagerduty(self):
+        if not self.pagerduty_ready:
+            pypd.api_key = self.pagerduty_api_key
+            self.http.install_pypd()
+            self.pagerduty_ready = True
+        return pypd
+
+    def support_now(self, just_name=False, profile=None):
+        user = self.on_call(profile)[0]
+        if just_name:
+            return user
+        if not user:
+            return "Nobody is on support now! :fire::fire::fire:"
+        return "%s is on support now." % (user,)
+
+    # (who's on support now or None, when that could next change or
+    # None if the schedule doesn't say)
+    def on_call(self, profile=None):
+        profile = profile or self.default_profile
+        if profile.pagerduty_policy:
+            policy = self.pd_policies.get(profile.pagerduty_policy)
+            if not policy:
+                policy = self.pagerduty().EscalationPolicy.find_one(
+                    name=profile.pagerduty_policy)
+                self.pd_policies[profile.pagerduty_policy] = policy
+            on_call = self.pagerduty().OnCall.find_one(
+                escalation_policy_ids=[policy.id])
 
             # nobody on call!
             if not on_call:
-                if just_name:
-                    return None
-                return "Nobody is on support now! :fire::fire::fire:"
-
-            # got someone, return name or sentence
-            user = self.slack_name_for_full_name(on_call['user']['summary'])
-            if just_name:
-                return user
-            return "%s is on support now." % (user,)
+                return None, None
+
+            until = on_call.get('end')
+            return (self.slack_name_for_full_name(on_call['user']['summary']),
+                    dateutil.parser.parse(until) if until else None)
         else:
-            cal = self.refresh_support_calendar()
+            cal = self.refresh_support_calendar(profile=profile)
             now = datetime.now(tz=TZ)
+            user = None
             for c in cal:
                 if now >= c[0] and now <= c[1]:
-                    if just_name:
-                        return c[2]
-                    return "%s is on support now." % (c[2],)
-            if just_name:
-                return None
-            return "Nobody is on support now! :fire::fire::fire:"
-
-    def support_day(self, offset=0):
-        if USE_PAGERDUTY:
+                    user = c[2]
+                    break
+            boundaries = [t for c in cal for t in c[:2] if t > now]
+            return user, min(boundaries) if boundaries else None
+
+    def support_day(self, offset=0, profile=None):
+        profile = profile or self.default_profile
+        if profile.pagerduty_policy:
             return "Unavailable via PagerDuty - ask Sam to implement."
         
-        cal = self.refresh_support_calendar()
+        cal = self.refresh_support_calendar(profile=profile)
         now = datetime.now(tz=TZ) + timedelta(days=offset)
 
         today = []
@@ -599,77 +2762,61 @@ class ScoutBot:
                ("%d day(s) from now" % offset if offset else "today")
 
     def slack_name_for_full_name(self, orig):
-        if not self.slack_connected or not self.slack_user_names:
+        if not self.slack_connected or not len(self.slack_names):
             return orig
 
-        full = orig.lower()
-        parts = re.split(r'\W+', full)
-
-        # look for match on full name
-        if full.lower() in self.slack_user_names:
-            return "<@%s>" % (self.slack_user_names[full.lower()],)
-
-        # look for a match on first name
-        if parts[0] in self.slack_user_names:
-            return "<@%s>" % (self.slack_user_names[parts[0]],)
-
-        # look for initials
-        initials = ''.join([p[0] for p in parts])
-        if initials in self.slack_user_names:
-            return "<@%s>" % (self.slack_user_names[initials],)
+        user_id, ambiguous = self.slack_names.lookup(orig)
+        if user_id:
+            return "<@%s>" % (user_id,)
 
-        # look for the case where someone uses a three-initial handle
-        # but only lists their first and last on the calendar...  Lame.
-        if len(parts) == 2:
-            import string
-            for middle in string.ascii_lowercase:
-                initials = parts[0][0] + middle + parts[1][0]
-                if initials in self.slack_user_names:
-                    return "<@%s>" % (self.slack_user_names[initials],)
+        if ambiguous and orig not in self.slack_ambiguous_names:
+            self.slack_ambiguous_names.add(orig)
+            self.log("*** %r could be any of %s in Slack, not guessing" %
+                     (orig, ', '.join(ambiguous)))
 
         # failure!
         return orig
 
     # pull a fresh calendar from Google periodically
-    def refresh_support_calendar(self, use_cache=True):
-        if USE_PAGERDUTY:
+    def refresh_support_calendar(self, use_cache=True, profile=None):
+        profile = profile or self.default_profile
+        if profile.pagerduty_policy:
             return
 
+        # profiles sharing a calendar share its cached copy
+        calendar_id = profile.support_calendar_id
+        calendar, refreshed_at = self.calendars.get(calendar_id, ([], None))
         if (use_cache and
-            len(self.calendar) and
-            self.calendar_refreshed_at and
-            (datetime.utcnow() - self.calendar_refreshed_at) <
+            len(calendar) and
+            refreshed_at and
+            (datetime.utcnow() - refreshed_at) <
               CALENDAR_REFRESH_INTERVAL):
-            return self.calendar
+            return calendar
 
-        self.log("*** Refreshing support calendar...")
-    
-        SCOPES             = 'https://www.googleapis.com/auth/calendar.readonly'
-        CLIENT_SECRET_FILE = 'google_api_client_secret.json'
-        APPLICATION_NAME   = 'ScoutBot'
+        with self.calendar_lock:
+            # another thread may have fetched it while we waited
+            latest, latest_at = self.calendars.get(calendar_id, ([], None))
+            if use_cache and latest_at != refreshed_at:
+                return latest
+            return self._fetch_support_calendar(calendar_id)
 
-        credential_path    = 'google_api_credentials.json'
-        store              = oauth2client.file.Storage(credential_path)
-        credentials        = store.get()
-        if not credentials:
-            raise Exception("Please setup a valid Google API credentials "
-                            "file in google_api_credentials.json.")
-        
-        http               = credentials.authorize(httplib2.Http())
-        service            = discovery.build('calendar', 'v3', http=http)
+    def _fetch_support_calendar(self, calendar_id):
+        self.log("*** Refreshing support calendar %s..." % (calendar_id,))
+    
+        service = self._calendar_service()
 
         start = datetime.utcnow() - timedelta(days = 1)
         end = start + timedelta(days = 14)
         
         eventsResult = service.events().list(
-            calendarId=self.support_calendar_id,
+            calendarId=calendar_id,
             timeMin=start.isoformat() + "Z",
             timeMax=end.isoformat() + "Z",
             singleEvents=True,
             orderBy='startTime').execute()
         events = eventsResult.get('items', [])
 
-        self.calendar = []
+        calendar = []
         for event in events:
             try:
                 start = dateutil.parser.parse(
@@ -682,66 +2829,314 @@ class ScoutBot:
                                      event['start'].get('date')))
                 end = end.astimezone(tz=TZ)
 
-                self.calendar.append((start, end, self.slack_name_for_full_name(event['summary'])))
+                calendar.append((start, end, self.slack_name_for_full_name(event['summary'])))
             except Exception, e:
                 # sometimes there's weird stuff on the calendar that
                 # can't be parsed, ignore it
                 pass
 
-        self.calendar_refreshed_at = datetime.utcnow()
-        return self.calendar
+        self.calendars[calendar_id] = (calendar, datetime.utcnow())
+        return calendar
+
+    # build the Calendar service once; authorize() wraps the pooled
+    # httplib2 object so doing it per refresh would stack wrappers
+    def _calendar_service(self):
+        if self.calendar_service:
+            return self.calendar_service
+
+        SCOPES             = 'https://www.googleapis.com/auth/calendar.readonly'
+        CLIENT_SECRET_FILE = 'google_api_client_secret.json'
+        APPLICATION_NAME   = 'ScoutBot'
+
+        credential_path    = 'google_api_credentials.json'
+        store              = oauth2client.file.Storage(credential_path)
+        credentials        = store.get()
+        if not credentials:
+            raise Exception("Please setup a valid Google API credentials "
+                            "file in google_api_credentials.json.")
+
+        http               = credentials.authorize(
+            self.http.httplib2('google'))
+        self.calendar_service = discovery.build('calendar', 'v3', http=http)
+        return self.calendar_service
 
     def _index_slack_names(self):
         # index user IDs by name and real_name to try to match up
         # support shift names
-        self.slack_user_names = {}
-        for user in self.sc.server.users:
-            self.slack_user_names[user.name.lower()] = user.id
-            self.slack_user_names[user.real_name.lower()] = user.id
+        self.slack_names = SlackNameIndex(self.sc.server.users)
+
+    # keep the name index current as people join or change their names
+    def slackbot_directory_events(self, msgs):
+        for msg in msgs:
+            if msg.get('type') in ('channel_joined', 'group_joined'):
+                channel = msg['channel']
+                if not self.sc.server.channels.find(channel['id']):
+                    self.sc.server.attach_channel(
+                        channel.get('name', channel['id']), channel['id'],
+                        channel.get('members', []))
+                continue
+            if msg.get('type') not in ('team_join', 'user_change'):
+                continue
+            self.slack_names.update(msg['user'])
+            if self.poller:
+                self.to_poller.put(('user', msg['user']))
+
+    # Multi-process mode: a poller process does the HelpScout scans,
+    # thread parsing and alert decisions, and sends ticket snapshots and
+    # messages to send over a pipe (one select() can wait on).  This process keeps the RTM
+    # connection and does nothing but talk to Slack, so a slow scan
+    # never holds up a reply.
+    def slackbot_split(self):
+        self._start_poller()
+        self.slackbot()
+
+    def _start_poller(self):
+        if self.poller:
+            self.from_poller.close()
+        self.from_poller, self.to_responder = multiprocessing.Pipe(False)
+        self.to_poller = multiprocessing.Queue()
+        self.poller = multiprocessing.Process(target=self._poller_main,
+                                              name='scoutbot-poller')
+        self.poller.daemon = True
+        self.poller.start()
+        # only the poller writes, so its exit reads as end of file
+        self.to_responder.close()
+        self.poller_started_at = time()
+
+    def _poller_main(self):
+        # Ctrl-C is for the responder, which then terminates us; either
+        # way the lease is let go rather than left to run out
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.from_poller.close()
+
+        # nothing opened before the fork can be shared with the parent,
+        # and a restarted poller is forked from a parent whose command
+        # threads may have been holding any of its locks
+        self.poller = None
+        self.outbox = self.to_responder
+        self.http = HTTPPool()
+        self.pagerduty_ready = False
+        self.memory = SharedMemory(self.memory.path)
+        self.client = pooled_helpscout(self.hs_app_id, self.hs_app_secret,
+                                       self.http, log=self.log,
+                                       limiter=SharedTokenBucket(self.memory))
+        self.ticket_view = TicketView(self.memory)
+        self.ticket_cache = TicketCache()
+        self.search_index = SearchIndex()
+        self.calendar_lock = threading.RLock()
+        self.commands = None
+        self.slack_sender = None
+        self.alert_ledger.memory = self.memory
+        self.lease = LeaderLease(self.memory)
+        self.lease_checked_at = 0
+        self.is_leader = False
+        self.slack_stack = []
+        self.dm_stack = []
+        try:
+            self._poll()
+        finally:
+            self.lease.release()
+
+    def _poll(self):
+        failures = 0
+        while True:
+            wait = LEADER_RENEW_INTERVAL
+            try:
+                if self.lead():
+                    if datetime.utcnow() >= self.next_helpscout_scan:
+                        # in case the scan blows up before scheduling
+                        # the next one itself
+                        self.next_helpscout_scan = datetime.utcnow() + \
+                                                   HELPSCOUT_SCAN_INTERVAL
+                        try:
+                            self.watch(once=True)
+                        except NotLeader, e:
+                            self.stand_down(e)
+                        self.outbox.send(('snapshot',
+                                          self.helpscout_current_tickets))
+                    elif time() >= self.next_shift_check():
+                        try:
+                            self.shift_change()
+                        except NotLeader, e:
+                            self.stand_down(e)
+                    wait = min(wait, max(0, (self.next_helpscout_scan -
+                                             datetime.utcnow()).total_seconds()),
+                               max(0, self.next_shift_check() - time()))
+                failures = 0
+            except Exception, e:
+                self.log("*** Caught error from poller: %r" % (e,))
+                import traceback
+                traceback.print_exc()
+                wait = min(POLLER_RETRY_MAX,
+                           POLLER_RETRY_MIN * 2 ** failures) * \
+                       random.uniform(0.5, 1)
+                failures += 1
+
+            # a deposed leader's posts and DMs go nowhere
+            leader = self.is_leader and self.lease.held()
+            self.outbox.send(('leader', leader))
+            if leader:
+                for item in self.slack_stack:
+                    self.outbox.send(('post',) + tuple(item))
+                for user, msg in self.dm_stack:
+                    self.outbox.send(('dm', user, msg))
+            self.slack_stack = []
+            self.dm_stack = []
+
+            # directory updates are taken as they come, but don't end
+            # the wait early: that would cut an error backoff short
+            until = time() + wait
+            while True:
+                try:
+                    kind, value = self.to_poller.get(
+                        timeout=max(0, until - time()))
+                except Queue.Empty:
+                    break
+                if kind == 'names':
+                    self.slack_names = value
+                    self.slack_connected = True
+                elif kind == 'user':
+                    self.slack_names.update(value)
+
+    def slackbot_poller_input(self):
+        # a poller that died can't be the leader; start another
+        if not self.poller.is_alive():
+            if self.poller_is_leader:
+                self.log("*** Poller exited with %r, standing by" %
+                         (self.poller.exitcode,))
+                self.poller_is_leader = False
+                self.slack_stack = []
+            if time() - self.poller_started_at >= POLLER_RESTART_INTERVAL:
+                self.log("*** Restarting the poller")
+                self._start_poller()
+                if self.slack_connected:
+                    self.to_poller.put(('names', self.slack_names))
+            return
+
+        while self.from_poller.poll():
+            try:
+                item = self.from_poller.recv()
+            except EOFError:
+                # the poller is gone; the next call restarts it
+                return
+            if item[0] == 'snapshot':
+                self.apply_snapshot(item[1])
+            elif item[0] == 'leader':
+                self.poller_is_leader = item[1]
+            elif item[0] == 'post':
+                self.slack_stack.append(item[1:])
+            elif item[0] == 'dm':
+                self.slackbot_direct_message(*item[1:])
+            elif item[0] == 'index':
+                self.search_index.put(*item[1:])
 
     def slackbot(self):
+        # the self-pipe slackbot_wake() uses to interrupt select()
+        self.slack_wakeup = os.pipe()
+        for fd in self.slack_wakeup:
+            fcntl.fcntl(fd, fcntl.F_SETFL,
+                        fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        failures = 0
         while True:
+            started = time()
             try:
                 self._slackbot()
             except Exception, e:
                 print "Caught error from slackbot: %r" % e
                 import sys, traceback
                 traceback.print_exc()
-                print "Pausing and reconnecting after 10 seconds..."
-            sleep(10)
 
-    def _slackbot(self):
-        self.sc = SlackClient(self.slack_api_key)
+            # a connection that stayed up a while starts the backoff over
+            if time() - started > SLACK_RECONNECT_MAX:
+                failures = 0
+            wait = min(SLACK_RECONNECT_MAX,
+                       SLACK_RECONNECT_MIN * 2 ** failures) * \
+                   random.uniform(0.5, 1)
+            failures += 1
+            print "Pausing and reconnecting after %.1f seconds..." % (wait,)
+            sleep(wait)
+
+    # A full rtm.start the first time, or when the directories it
+    # brought are too old to trust; otherwise just a new websocket, with
+    # the users and channels we already have (kept current by
+    # slackbot_directory_events).  Either way whatever is left in
+    # slack_stack goes out once we're back.
+    def slackbot_connect(self):
+        start = time()
+        if (self.sc is not None and self.slack_directory_at and
+            datetime.utcnow() - self.slack_directory_at <
+            SLACK_DIRECTORY_MAX_AGE):
+            try:
+                self.sc.server.websocket.close()
+            except Exception:
+                pass
+            reply = json.loads(self.sc.server.api_call('rtm.connect'))
+            if reply.get('ok'):
+                self.sc.server.connect_slack_websocket(reply['url'])
+            else:
+                self.sc.server.rtm_connect(reconnect=True)
+            self.log("*** Reconnected to Slack in %.2fs" % (time() - start,))
+            return True
 
-        if self.sc.rtm_connect():
-            self.slack_connected = True
+        self.sc = slackclient.SlackClient(self.slack_api_key)
+        self.sc.server.api_requester = PooledSlackRequest(self.http)
+        if not self.sc.rtm_connect():
+            return False
 
-            # need this so I can scan for messages @me
-            slack_bot_user = self.sc.server.users.find(self.slack_bot_name)
-            if not slack_bot_user:
-                raise Exception("Failed to load user for name %r" % (self.slack_bot_name,))
-            self.slack_bot_user_id = slack_bot_user.id
+        # need this so I can scan for messages @me
+        slack_bot_user = self.sc.server.users.find(self.slack_bot_name)
+        if not slack_bot_user:
+            raise Exception("Failed to load user for name %r" % (self.slack_bot_name,))
+        self.slack_bot_user_id = slack_bot_user.id
+
+        self._index_slack_names()
+        if self.poller:
+            self.to_poller.put(('names', self.slack_names))
+        self.slack_directory_at = datetime.utcnow()
+        self.log("*** Connected to Slack in %.2fs" % (time() - start,))
+        return True
 
-            self._index_slack_names()
+    def _slackbot(self):
+        if self.slackbot_connect():
+            self.slack_connected = True
 
             while True:
                 msg = self.sc.rtm_read()
-                self.slackbot_input(msg)
-                self.slackbot_output()
+                self.slackbot_directory_events(msg)
+                if self.poller:
+                    self.slackbot_poller_input()
+                try:
+                    if self.lead():
+                        self.slackbot_input(msg)
+                        self.slackbot_commands()
+                        self.slackbot_output()
+
+                        if (not self.poller and
+                            datetime.utcnow() >= self.next_helpscout_scan):
+                            # fallback in case the scan blows up before
+                            # scheduling the next one itself
+                            self.next_helpscout_scan = datetime.utcnow() + \
+                                                       HELPSCOUT_SCAN_INTERVAL
+                            self.watch(once=True)
+                        elif (not self.poller and
+                              time() >= self.next_shift_check()):
+                            self.shift_change()
+                except NotLeader, e:
+                    self.stand_down(e)
+                self.slackbot_sent()
                 self.slackbot_autoping()
-
-                if ((datetime.utcnow() - self.last_helpscout_scan) >
-                    HELPSCOUT_SCAN_INTERVAL):
-                    self.last_helpscout_scan = datetime.utcnow()
-                    self.watch(once=True)
                     
-                if not USE_PAGERDUTY:
-                    if ((datetime.utcnow() - self.last_calender_scan) >
-                        CALENDAR_SCAN_INTERVAL):
-                        self.last_calender_scan = datetime.utcnow()
-                        self.refresh_support_calendar()
-
-                sleep(0.25)
+                if ((datetime.utcnow() - self.last_calender_scan) >
+                    CALENDAR_SCAN_INTERVAL):
+                    self.last_calender_scan = datetime.utcnow()
+                    for profile in self.profiles:
+                        if not profile.pagerduty_policy:
+                            self.refresh_support_calendar(profile=profile)
+
+                # keep reading while messages keep coming
+                if not msg:
+                    self.slackbot_wait()
         else:
             print "Connection Failed, invalid token?"
 
@@ -772,6 +3167,7 @@ class ScoutBot:
 
         self.memory['ignore_list'] = ignore_list
         self.memory['ignored_at']  = ignored_at
+        self.ticket_view.invalidate()
 
         return "Cool, I'll stop worrying about %s (until another reply comes in).  To undo respond 'unignore %s'." % (num, num)
 
@@ -789,6 +3185,7 @@ class ScoutBot:
 
         self.memory['ignore_list'] = ignore_list
         self.memory['ignored_at']  = ignored_at
+        self.ticket_view.invalidate()
 
         return "Ok, I'll start worrying about %s again.  To undo respond 'ignore %s'." % (num, num)
 
@@ -800,6 +3197,7 @@ class ScoutBot:
         snooze = self.memory['snooze']
         snooze[int(num)] = datetime.utcnow() + timedelta(minutes=time)
         self.memory['snooze'] = snooze
+        self.ticket_view.invalidate()
 
         return "Cool, snoozing %s for %d minutes.  To undo respond 'unsnooze %s'." % (num, time, num)
 
@@ -807,9 +3205,20 @@ class ScoutBot:
         snooze = self.memory['snooze']
         del snooze[int(num)]
         self.memory['snooze'] = snooze
+        self.ticket_view.invalidate()
 
         return "Ok, I'll start worrying about %s again.  To undo respond 'snooze %s'." % (num, num)
 
+    def slackbot_search(self, query):
+        results, total = self.search_index.search(query)
+        if not results:
+            return "I didn't find any recent tickets mentioning %s." % (query,)
+        lines = ["[<%s|#%s>] %s" % (url, num, subject)
+                 for num, id, subject, url in results]
+        if total > len(results):
+            lines.append("...and %d more." % (total - len(results),))
+        return "\n".join(lines)
+
     def slackbot_handle(self, msg):
         msg_type   = msg.get("type", "")
         text       = msg.get("text", "")
@@ -823,19 +3232,13 @@ class ScoutBot:
             if user_id == self.slack_bot_user_id:
                 return
 
-            # if someone mentions a ticket number, post a helpful link
-            if re.search(r'\b(?:hs|helpscout)\s?[#]?(\d+)\b', text, re.I):
-                match = re.search(r'\b(?:hs|helpscout)\s?[#]?(\d+)\b',
+            # if someone mentions ticket or bug numbers, post helpful links
+            hs_nums = re.findall(r'\b(?:hs|helpscout)\s?[#]?(\d+)\b',
+                                 text, re.I)
+            bug_nums = re.findall(r'\b(?:bug|bugzilla)\s?[#]?(\d+)\b',
                                   text, re.I)
-                ticket_num = match.groups(1)[0];
-                self.slackbot_link_hs(msg, ticket_num)
-
-            # if someone mentions a ticket number, post a helpful link
-            if re.search(r'\b(?:bug|bugzilla)\s?[#]?(\d+)\b', text, re.I):
-                match = re.search(r'\b(?:bug|bugzilla)\s?[#]?(\d+)\b',
-                                  text, re.I)
-                bug_num = match.groups(1)[0];
-                self.slackbot_bugzilla_link(msg, bug_num)
+            if hs_nums or bug_nums:
+                self.slackbot_link_mentions(msg, hs_nums, bug_nums)
 
             # only look for the below commands if targeted directly
             if (not re.search(r'\b%s\b' % self.slack_bot_name, text, re.I) and
@@ -884,6 +3287,45 @@ class ScoutBot:
                     self.slackbot_unsnooze_ticket(match.groups(1)[0]))
                 return
 
+            # "support now billing" etc. ask about a particular profile
+            profile = self._profile_for_text(text)
+
+            match = re.search(r'\bsearch\s+(.+)$', text, re.I)
+            if match:
+                self.slackbot_reply(msg, self.slackbot_search(match.group(1)))
+                return
+
+            match = re.search(r'\bsla\s+(report|by\s+person)\b'
+                              r'(?:\s+(\d+)\s+days?)?', text, re.I)
+            if match:
+                days = int(match.group(2) or 7)
+                if match.group(1).lower() == 'report':
+                    self.slackbot_run(msg, 'sla', lambda:
+                                      self.sla_report(days, profile))
+                else:
+                    self.slackbot_run(msg, 'sla', lambda:
+                                      self.sla_by_person(days, profile))
+                return
+
+            if re.search(r'\bstatus\s+mine\b', text, re.I):
+                self.slackbot_run(msg, 'status', lambda:
+                                  self.helpscout_status_mine(user_id, profile))
+                return
+
+            match = re.search(r'\bstatus\s+folder\s+(\S.*?)\s*$', text, re.I)
+            if match:
+                self.slackbot_run(msg, 'status', lambda:
+                                  self.helpscout_status_folder(match.group(1),
+                                                               profile))
+                return
+
+            match = re.search(r'\boldest(?:\s+(\d+))?\b', text, re.I)
+            if match:
+                self.slackbot_reply(
+                    msg, self.helpscout_oldest(int(match.group(1) or 5),
+                                               profile))
+                return
+
             if re.search(r'\bsupport\b', text, re.I):
                 days_since = re.search(r'\b(\w+)\s+days?\b', text, re.I)
                 if days_since:
@@ -891,27 +3333,32 @@ class ScoutBot:
                            re.match(r'\d+', days_since.group(1)) else \
                            text2int(days_since.group(1))
                     if days:
-                        self.slackbot_reply(msg, self.support_day(offset=days))
+                        self.slackbot_run(msg, 'support', lambda:
+                            self.support_day(offset=days, profile=profile))
                         return
 
             if re.search(r'\b(on\s+)?support\b', text, re.I) and \
                re.search(r'\bnow\b', text, re.I):
-                self.slackbot_reply(msg, self.support_now())
+                self.slackbot_run(msg, 'support', lambda:
+                                  self.support_now(profile=profile))
                 return
 
             if re.search(r'\b(on\s+)?support\b', text, re.I) and \
                re.search(r'\btoday\b', text, re.I):
-                self.slackbot_reply(msg, self.support_day())
+                self.slackbot_run(msg, 'support', lambda:
+                                  self.support_day(profile=profile))
                 return
 
             if re.search(r'\bsupport\b', text, re.I) and \
                re.search(r'\btomorrow\b', text, re.I):
-                self.slackbot_reply(msg, self.support_day(offset=1))
+                self.slackbot_run(msg, 'support', lambda:
+                                  self.support_day(offset=1, profile=profile))
                 return
 
             if re.search(r'\bhelpscout\b', text, re.I) and \
                re.search(r'\bstatus\b', text, re.I):
-                self.slackbot_reply(msg, self.helpscout_status())
+                self.slackbot_run(msg, 'status', lambda:
+                                  self.helpscout_status(profile))
                 return
 
             if re.search(r'\blouder\b', text, re.I):
@@ -926,7 +3373,7 @@ class ScoutBot:
                re.search(r'\bexcuse\b', text, re.I) or \
                re.search(r'\bjoke\b', text, re.I) or \
                re.search(r'\bwhat\'s\s+up\b', text, re.I):
-                self.slackbot_reply(msg, self.joke())
+                self.slackbot_run(msg, 'joke', self.joke)
                 return
     
     def set_user_loudness(self, user_id, setting):
@@ -954,11 +3401,10 @@ class ScoutBot:
 
     def joke(self):
         try:
-            h = httplib2.Http(".cache")
-            (resp_headers, content) = h.request(
+            data = self.http.request(
+                'get',
                 "http://api.icndb.com/jokes/random?firstName=Cal&lastName=Bot",
-                "GET")
-            data = json.loads(content)
+                timeout=5).json()
             joke = data['value']['joke']
             joke = re.sub(r'&amp;', '&', joke)
             joke = re.sub(r'&lt;', '<', joke)
@@ -977,6 +3423,14 @@ class ScoutBot:
         support X days from now
 
         helpscout status
+        status mine     - active tickets assigned to you
+        status folder X - active tickets in folder X (name or id)
+        oldest [N]      - the N tickets waiting longest, 5 by default
+
+        search WORDS - recent tickets mentioning all of WORDS
+
+        sla report [N days]    - wait times and breaches, 7 days by default
+        sla by person [N days] - the same, by who was on support
 
         ignore XXX   - ignore ticket XXX
         unignore XXX - stop ignoring ticket XXX        
@@ -991,53 +3445,144 @@ class ScoutBot:
         quieter - stop getting pinged as tickets arrive
         """
 
-    def slackbot_link_hs(self, msg, num):
-        " Get description and link to HS conversation  "
-        if num in self.last_hs_link:
-            if ((datetime.utcnow() - self.last_hs_link[num])
-                < ANNOYANCE_FREQUENCY):
-                return
-
-        client = self.client
-
-        url = None
-        subject = None
-        for result in client.conversations.get(params=dict(number=num)):
-            if int(result.number) == int(num):
-                url = "https://secure.helpscout.net/conversation/%s" % result.id
-                subject = result.subject
-                break
-
-        if url:
-            self.slackbot_reply(msg,
-                                "HelpScout [<{url}|#{num}>] - {subject}".format(
-                                    num=num,
-                                    url=url,
-                                    subject=subject))
-            self.last_hs_link[num] = datetime.utcnow()
-
-    def slackbot_bugzilla_link(self, msg, num):
-        if num in self.last_bugzilla_link:
-            if ((datetime.utcnow() - self.last_bugzilla_link[num])
-                < ANNOYANCE_FREQUENCY):
-                return
-        url = self.bugzilla_url + 'show_bug.cgi?id=' + num
-        self.slackbot_reply(msg,
-                            "Bugzilla [<{url}|#{num}>]".format(
-                                num=num,
-                                url=url))
-        self.last_bugzilla_link[num] = datetime.utcnow()
+    # Link every ticket and bug mentioned in a message, in one reply.
+    # When every ticket is cached the reply goes straight out; otherwise
+    # the missing ones are looked up in the background, together, with
+    # a single HelpScout search per HELPSCOUT_LOOKUP_BATCH numbers, and
+    # the reply (bugs included) waits for that.
+    def slackbot_link_mentions(self, msg, hs_nums, bug_nums):
+        now = datetime.utcnow()
+
+        def fresh(nums, last_link):
+            nums = [n for i, n in enumerate(nums) if n not in nums[:i]]
+            return [n for n in nums if n not in last_link or
+                    now - last_link[n] >= ANNOYANCE_FREQUENCY]
+        hs_nums = fresh(hs_nums, self.last_hs_link)
+        bug_nums = fresh(bug_nums, self.last_bugzilla_link)
+
+        # marked up front, so mentions while a lookup is running don't
+        # start another one
+        for num in hs_nums:
+            self.last_hs_link[num] = now
+        for num in bug_nums:
+            self.last_bugzilla_link[num] = now
+
+        tickets = {}
+        for num in hs_nums:
+            cached = self.ticket_cache.get(num)
+            if cached:
+                tickets[num] = cached
+        missing = [n for n in hs_nums if n not in tickets]
+        if missing:
+            # someone just mentioned them, so no "On it..."
+            self.slackbot_run(msg, 'links', lambda: self._link_lines(
+                hs_nums, bug_nums,
+                dict(tickets, **self.lookup_tickets(missing))),
+                ack=False)
+        else:
+            self.slackbot_reply(msg, self._link_lines(hs_nums, bug_nums,
+                                                      tickets))
+
+    def _link_lines(self, hs_nums, bug_nums, tickets):
+        lines = []
+        for num in hs_nums:
+            if num in tickets:
+                id, subject, url = tickets[num]
+                lines.append("HelpScout [<{url}|#{num}>] - {subject}".format(
+                    num=num, url=url, subject=subject))
+            else:
+                # not a ticket after all; let the next mention try again
+                self.last_hs_link.pop(num, None)
+        for num in bug_nums:
+            url = self.bugzilla_url + 'show_bug.cgi?id=' + num
+            lines.append("Bugzilla [<{url}|#{num}>]".format(num=num, url=url))
+        return "\n".join(lines)
+
+    # ticket number => (id, subject, url) for whichever of nums exist
+    def lookup_tickets(self, nums):
+        found = {}
+        with self.client.interactive():
+            for i in range(0, len(nums), HELPSCOUT_LOOKUP_BATCH):
+                batch = nums[i:i + HELPSCOUT_LOOKUP_BATCH]
+                # answer under the number as it was typed, e.g. "0123"
+                typed = dict((int(n), n) for n in batch)
+                query = urllib.quote('(%s)' % ' OR '.join(
+                    'number:%d' % n for n in sorted(typed)))
+                for result in self.client.conversations.get(
+                        params=dict(query=query, status='all')):
+                    num = typed.get(int(result.number))
+                    if num is not None:
+                        url = "https://secure.helpscout.net/conversation/%s" % result.id
+                        self.ticket_cache.put(num, result.id, result.subject, url)
+                        found[num] = (result.id, result.subject, url)
+        return found
 
     def slackbot_reply(self, msg, response):
-        self.slack_stack.append((msg['channel'], response))
+        if response:
+            self.slack_stack.append((msg['channel'], response))
+
+    # answer msg with call()'s result once one of the command threads
+    # gets to it
+    def slackbot_run(self, msg, name, call, ack=True):
+        if self.commands is None:
+            self.commands = CommandRunner(wake=self.slackbot_wake)
+        if not self.commands.submit(name, call, msg, COMMAND_TIMEOUTS[name],
+                                    ack=ack):
+            self.log("*** Too many commands waiting, turned down %s" %
+                     (name,))
+            if ack:
+                self.slackbot_reply(msg, "I'm swamped right now, ask me again in a minute.")
+
+    # reply to finished commands, and to slow ones with "On it..." or
+    # an apology once they run out of time
+    def slackbot_commands(self):
+        if self.commands is None:
+            return
+        for job, result, error in self.commands.finished():
+            name, call, msg, submitted, deadline, state = job
+            if state == 'expired':
+                self.log("*** %s finished after %.1fs, too late to answer" %
+                         (name, time() - submitted))
+            elif error:
+                self.log("*** %s failed: %r" % (name, error))
+                if state != 'quiet':
+                    self.slackbot_reply(msg, "Sorry, something went wrong there.")
+            else:
+                self.slackbot_reply(msg, result)
 
-    def slackbot_broadcast(self, msg):
-        for channel in self.slack_channels:
+        now = time()
+        for job in self.commands.pending:
+            name, call, msg, submitted, deadline, state = job
+            if state == 'expired':
+                continue
+            if now >= deadline:
+                job[5] = 'expired'
+                self.log("*** %s timed out after %.1fs" % (name,
+                                                           now - submitted))
+                if state != 'quiet':
+                    self.slackbot_reply(msg, "Sorry, that's taking too long.  Try again in a bit?")
+            elif state == 'waiting' and now >= submitted + COMMAND_ACK_AFTER:
+                job[5] = 'acked'
+                self.slackbot_reply(msg, "On it...")
+
+    def slackbot_broadcast(self, msg, profile=None):
+        for channel in (profile or self.default_profile).slack_channels:
             self.slack_stack.append((channel, msg))
 
     def slackbot_direct_message(self, user, msg):
         now = datetime.now(tz=TZ)
-        if now.date() in HOLIDAY:
+        if self.support_hours.is_holiday(now.date()):
+            return
+
+        # the poller has no Slack connection, it hands DMs to the
+        # responder along with its channel posts
+        if self.outbox:
+            self.dm_stack.append((user, msg))
+            return
+
+        if not self.may_post():
+            self.log("Suppressing send of %s to %s: not the leader." %
+                     (msg, user))
             return
 
         # strip out slack formatting
@@ -1049,31 +3594,164 @@ class ScoutBot:
                      (msg, user))
             return
 
-        dm_channel = json.loads(self.sc.server.api_call('im.open', user=user))
-        if "channel" in dm_channel:
-            self.slack_stack.append((dm_channel['channel']['id'], msg))
-        else:
-            self.log("Failed to open IM channel to %r: %r" % (user, dm_channel))
+        # the IM channel is opened (once per user) by the sender too, so
+        # neither call holds up the RTM loop
+        def send():
+            if user not in self.slack_dm_channels:
+                dm_channel = json.loads(self.sc.server.api_call('im.open',
+                                                                user=user))
+                if "channel" not in dm_channel:
+                    raise SlackError(dm_channel)
+                self.slack_dm_channels[user] = dm_channel['channel']['id']
+            self._slack_post(self.slack_dm_channels[user], msg)
+
+        def failed(e):
+            self.log("Failed to IM %r: %r" % (user, e))
             self.slackbot_broadcast("Tried to IM %r but couldn't!  If you see them, can you tell them '%s' for me?" % (user, msg))
 
+        self._slack_sender().send(('im', user), send, failed)
+
+    def _slack_sender(self):
+        if self.slack_sender is None:
+            self.slack_sender = SlackSender(wake=self.slackbot_wake)
+        return self.slack_sender
+
+    def _slack_post(self, channel_id, text):
+        # need to do this not send_message to get links to format
+        # correctly, oddly enough
+        reply = json.loads(self.sc.server.api_call(
+            'chat.postMessage', channel=channel_id,
+            text=translate_unicode(text), username=self.slack_bot_name,
+            as_user=True))
+        if not reply.get('ok'):
+            raise SlackError(reply.get('error', reply))
+
     def slackbot_output(self):
+        if not self.may_post():
+            self.slack_stack = []
+            return
         while len(self.slack_stack):
             msg = self.slack_stack.pop(0)
             channel = self.sc.server.channels.find(msg[0])
-            if not channel:
-                raise Exception("Could not find channel for msg %r" % (msg))
+            if channel:
+                channel_id = channel.id
+            elif re.match(r'[CDG][A-Z0-9]+$', msg[0]):
+                # a channel opened since our directory was loaded
+                channel_id = msg[0]
+            else:
+                self.log("*** Could not find channel for msg %r" % (msg,))
+                continue
+
+            self._slack_sender().send(
+                channel_id,
+                lambda channel_id=channel_id, text=msg[1]:
+                    self._slack_post(channel_id, text))
 
-            # need to do this not send_message to get links to format
-            # correctly, oddly enough
-            self.sc.server.api_call('chat.postMessage',
-                                    channel=channel.id,
-                                    text=translate_unicode(msg[1]),
-                                    username=self.slack_bot_name,
-                                    as_user=True)
+    # tally up what the sender got done since last time
+    def slackbot_sent(self):
+        if self.slack_sender is None:
+            return
+        for key, seconds, error, on_error in self.slack_sender.finished():
+            self.slack_sends += 1
+            self.slack_send_seconds += seconds
+            if error:
+                self.slack_send_failures += 1
+                if on_error:
+                    on_error(error)
+                else:
+                    self.log("*** Couldn't post to %s: %r" % (key, error))
+            elif seconds > SLACK_SLOW_SEND:
+                self.log("*** Slack took %.1fs to post to %s (%.2fs on "
+                         "average)" % (seconds, key, self.slack_send_seconds /
+                                       self.slack_sends))
 
     def slackbot_autoping(self):
-        #hardcode the interval to 3 seconds
-        now = int(time())
-        if now > self.slack_last_ping + 3:
+        now = time()
+        if now >= self.slack_last_ping + SLACK_PING_INTERVAL:
             self.sc.server.ping()
             self.slack_last_ping = now
+
+    # when the RTM loop next has something to do without being asked:
+    # ping, calendar refresh, lease renewal, scan or queued posts
+    def slackbot_next_job(self):
+        now = datetime.utcnow()
+        jobs = [self.slack_last_ping + SLACK_PING_INTERVAL,
+                time() + (self.last_calender_scan + CALENDAR_SCAN_INTERVAL -
+                          now).total_seconds()]
+        if not self.poller:
+            jobs.append(self.lease_checked_at + LEADER_RENEW_INTERVAL)
+            if self.is_leader:
+                jobs.append(time() + (self.next_helpscout_scan -
+                                      now).total_seconds())
+                jobs.append(self.next_shift_check())
+        if self.slack_stack:
+            jobs.append(0)
+        if self.commands and self.commands.next_deadline():
+            jobs.append(self.commands.next_deadline())
+        return min(jobs)
+
+    # other threads call this to cut slackbot_wait() short
+    def slackbot_wake(self):
+        if self.slack_wakeup is None:
+            return
+        try:
+            os.write(self.slack_wakeup[1], 'x')
+        except OSError, e:
+            # the pipe is full, so a wakeup is already pending
+            if e.errno != errno.EAGAIN:
+                raise
+
+    # Sleep until the websocket has something, another thread (the
+    # sender or the poller) has news, or the next job is due.
+    def slackbot_wait(self):
+        websocket = self.sc.server.websocket.sock
+        # TLS may have already read past the frame we were handed
+        if hasattr(websocket, 'pending') and websocket.pending():
+            return
+        fds = [websocket, self.slack_wakeup[0]]
+        # a dead poller's pipe reads as end of file, forever
+        if self.poller and self.poller.is_alive():
+            fds.append(self.from_poller)
+        readable = select.select(fds, [], [], max(
+            0, self.slackbot_next_job() - time()))[0]
+        if self.slack_wakeup[0] in readable:
+            try:
+                os.read(self.slack_wakeup[0], 4096)
+            except OSError, e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+
+# The "scoutbot" command: answers the same questions as chat, read-only,
+# so it can run while the bot is up (and alongside other queries).
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Ask ScoutBot who's on support or which HelpScout "
+                    "tickets are waiting, without starting the bot.")
+    parser.add_argument('query', choices=['now', 'today', 'tomorrow',
+                                          'day', 'status'])
+    parser.add_argument('days', nargs='?', type=int, default=0,
+                        help="for 'day', how many days from today")
+    parser.add_argument('--config', default='scoutbot.cfg')
+    parser.add_argument('--profile', help="team profile to ask about")
+    args = parser.parse_args(argv)
+
+    bot = ScoutBot(args.config, read_only=True)
+    profile = bot.profile_named(args.profile) if args.profile else None
+    if args.profile and not profile:
+        parser.error("no profile named %r" % (args.profile,))
+
+    if args.query == 'now':
+        print bot.support_now(profile=profile)
+    elif args.query == 'today':
+        print bot.support_day(profile=profile)
+    elif args.query == 'tomorrow':
+        print bot.support_day(offset=1, profile=profile)
+    elif args.query == 'day':
+        print bot.support_day(offset=args.days, profile=profile)
+    else:
+        bot.query_tickets()
+        print bot.helpscout_status(profile)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/bin/env python
+# Behaviour checks for what the benchmarks only time: support hours
+# around holidays and the new year, leader lease fencing, the Slack
+# name index and link mention dedupe.  Needs no config or network.
+# Prints "ok" for each check and stops at the first failing assert.
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from time import sleep
+
+import dateutil.parser
+
+import ScoutBot
+from ScoutBot import (TZ, LeaderLease, NotLeader, SharedMemory,
+                      SlackNameIndex, SupportHours, TicketCache, epoch)
+
+def at(*args):
+    return epoch(TZ.localize(datetime(*args)))
+
+def check_support_hours():
+    hours = SupportHours([0, 1, 2, 3, 4], dateutil.parser.parse('05:00'),
+                         dateutil.parser.parse('18:00'))
+    # Christmas Eve and Day are off, the Monday after isn't
+    assert hours.is_holiday(datetime(2026, 12, 24).date())
+    assert not hours.is_open(at(2026, 12, 25, 12))
+    assert hours.is_open(at(2026, 12, 28, 12))
+    assert not hours.is_open(at(2026, 12, 28, 4))
+
+    # New Year's Eve and Day are off too: from Wednesday 17:00 to the
+    # next Monday 06:00 is one hour either side
+    waits = hours.business_waits([at(2026, 12, 30, 17), None,
+                                  at(2027, 1, 4, 7)], at(2027, 1, 4, 6))
+    assert list(waits) == [7200.0, 0.0, 0.0], waits
+
+    # New Year's Eve 2027 is a Friday, so nothing opens until Monday
+    assert hours.next_open(at(2027, 12, 31, 12)) == at(2028, 1, 3, 5)
+    assert hours.next_open(at(2027, 1, 8, 18, 30)) == at(2027, 1, 11, 5)
+    # the table gets rebuilt for lookups years either side of it
+    assert hours.next_open(at(2031, 7, 4, 9)) == at(2031, 7, 7, 5)
+    assert hours.is_open(at(2026, 12, 30, 12))
+    assert not hours.is_open(at(2026, 12, 31, 12))
+    print "ok support hours"
+
+def check_leader_lease(path):
+    a = SharedMemory(path)
+    b = SharedMemory(path)
+    lease_a = LeaderLease(a, ttl=1.5)
+    lease_b = LeaderLease(b, ttl=1.5)
+    assert lease_a.acquire() and not lease_b.acquire()
+    a['who'] = 'a'
+    assert b['who'] == 'a'
+
+    # a stalls past its lease; b takes over with a new token
+    sleep(1.6)
+    assert not lease_a.held()
+    assert lease_b.acquire() and lease_b.token == lease_a.token + 1
+    try:
+        a['who'] = 'stale a'
+    except NotLeader:
+        pass
+    else:
+        assert False, "a write with an old token landed"
+    b['who'] = 'b'
+    assert a['who'] == 'b'
+
+    # released, the lease is free at once and the token keeps counting
+    token = lease_b.token
+    lease_b.release()
+    assert lease_a.acquire() and lease_a.token == token + 1
+    a.close()
+    b.close()
+    print "ok leader lease"
+
+class User:
+    def __init__(self, id, name, real_name):
+        self.id = id
+        self.name = name
+        self.real_name = real_name
+
+def check_name_index():
+    index = SlackNameIndex([User('U1', 'jjones', 'Jim Jones'),
+                            User('U2', 'mary', 'Maria Garcia'),
+                            User('U3', 'mkay', 'Mary Kay'),
+                            User('U4', 'mkane', 'Mark Kane')])
+    assert index.lookup('Jim Jones') == ('U1', ())
+    assert index.lookup('jjones') == ('U1', ())
+    assert index.lookup('Maria Garcia') == ('U2', ())
+    # a handle wins over someone else's first name
+    assert index.lookup('Mary') == ('U2', ())
+    assert index.lookup('M K') == (None, ('U3', 'U4'))
+    assert index.lookup('Mark') == ('U4', ())
+    # one word has no last name, so no "jj" for Jack
+    assert index.lookup('Jack') == (None, ())
+    assert index.handle('U2') == 'mary'
+
+    index.update(dict(id='U5', name='mk2', real_name='Mike Kim'))
+    assert index.lookup('M K') == (None, ('U3', 'U4', 'U5'))
+    index.update(dict(id='U1', deleted=True))
+    assert index.lookup('Jim Jones') == (None, ())
+    assert index.handle('U1') is None
+    print "ok name index"
+
+# just enough of a bot for slackbot_link_mentions
+class LinkBot:
+    slackbot_link_mentions = ScoutBot.ScoutBot.slackbot_link_mentions.im_func
+    _link_lines = ScoutBot.ScoutBot._link_lines.im_func
+    bugzilla_url = 'https://bugs.example.com/'
+
+    def __init__(self):
+        self.last_hs_link = dict()
+        self.last_bugzilla_link = dict()
+        self.ticket_cache = TicketCache()
+        self.replies = []
+        self.lookups = []
+
+    def slackbot_reply(self, msg, response):
+        if response:
+            self.replies.append(response)
+
+    def slackbot_run(self, msg, name, call, ack=True):
+        self.slackbot_reply(msg, call())
+
+    def lookup_tickets(self, nums):
+        self.lookups.append(nums)
+        return dict((num, (int(num), 'Ticket %s' % num, 'u%s' % num))
+                    for num in nums if num != '404')
+
+def check_link_mentions():
+    bot = LinkBot()
+    bot.ticket_cache.put(3, 1003, 'Cached', 'u3')
+    msg = dict(channel='C1')
+
+    # repeats within a message are linked once, in one reply, and only
+    # the uncached tickets are looked up
+    bot.slackbot_link_mentions(msg, ['3', '5', '3', '404'], ['12', '12'])
+    assert bot.lookups == [['5', '404']], bot.lookups
+    assert len(bot.replies) == 1
+    lines = bot.replies[0].split('\n')
+    assert len(lines) == 3 and '#3>' in lines[0] and '#5>' in lines[1] \
+           and '#12>' in lines[2], lines
+    # a number that isn't a ticket isn't remembered as linked
+    assert '404' not in bot.last_hs_link
+
+    # mentioned again straight away: nothing new to say
+    bot.slackbot_link_mentions(msg, ['3', '5'], ['12'])
+    assert len(bot.replies) == 1 and len(bot.lookups) == 1
+
+    # all cached: answered without a lookup
+    bot.slackbot_link_mentions(msg, ['3'], [])
+    assert len(bot.replies) == 1
+    bot.last_hs_link['3'] -= ScoutBot.ANNOYANCE_FREQUENCY
+    bot.slackbot_link_mentions(msg, ['3'], [])
+    assert len(bot.replies) == 2 and len(bot.lookups) == 1
+    print "ok link mentions"
+
+scratch = tempfile.mkdtemp()
+try:
+    check_support_hours()
+    check_leader_lease(os.path.join(scratch, 'scoutbot.db'))
+    check_name_index()
+    check_link_mentions()
+finally:
+    shutil.rmtree(scratch)
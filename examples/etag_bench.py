@@ -0,0 +1,93 @@
+#!/bin/env python
+# Runs a few scan-shaped passes (conversation list + threads for each
+# conversation) against a local fake HelpScout that supports ETags, and
+# reports requests, bytes downloaded and time per pass.  The first pass
+# downloads everything; later ones should be all 304s.
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import json
+import threading
+from time import time
+
+from ScoutBot import HTTPPool, TokenBucket, pooled_helpscout
+
+CONVERSATIONS = 200
+THREADS_PER_CONVERSATION = 10
+
+stats = dict(requests=0, not_modified=0, bytes=0)
+
+def conversation(num):
+    return dict(id=1000 + num, number=num, subject="Ticket %d" % num,
+                folderId=1, createdAt='2015-10-01T10:00:00Z')
+
+def threads(num):
+    return dict(_embedded=dict(threads=[
+        dict(createdAt='2015-10-01T10:%02d:00Z' % i,
+             createdBy=dict(email='client%d@example.org' % num),
+             body='Thread %d of ticket %d. ' % (i, num) * 20)
+        for i in range(THREADS_PER_CONVERSATION)]))
+
+class FakeHelpScout(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, obj):
+        body = json.dumps(obj)
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        stats['requests'] += 1
+        if self.headers.get('If-None-Match') == etag:
+            stats['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        stats['bytes'] += len(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_json(dict(access_token='token'))
+
+    def do_GET(self):
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if parts[-1] == 'threads':
+            self.send_json(threads(int(parts[-2]) - 1000))
+        else:
+            self.send_json(dict(_embedded=dict(conversations=[
+                conversation(n) for n in range(1, CONVERSATIONS + 1)])))
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+server = Server(('127.0.0.1', 0), FakeHelpScout)
+thread = threading.Thread(target=server.serve_forever)
+thread.daemon = True
+thread.start()
+
+# the fake server has no rate limit, so don't hold ourselves to one
+client = pooled_helpscout('id', 'secret', HTTPPool(),
+                          limiter=TokenBucket(per_minute=10 ** 6),
+                          base_url='http://127.0.0.1:%d/v2/' % server.server_port)
+
+for n in range(3):
+    before = dict(stats)
+    start = time()
+    for conv in client.conversations.get(params=dict(status='active')):
+        client.conversations[conv.id].threads.get()[0].threads
+    print "pass %d: %4d requests, %4d not modified, %8d bytes, %.3fs" % (
+        n + 1,
+        stats['requests'] - before['requests'],
+        stats['not_modified'] - before['not_modified'],
+        stats['bytes'] - before['bytes'],
+        time() - start)
@@ -0,0 +1,35 @@
+#!/bin/env python
+# Times a cold "import ScoutBot" in a fresh interpreter, and what each
+# backend adds once something touches it.  The one-line queries
+# (now.py, today.py) should stay under 200ms.
+import os
+import subprocess
+import sys
+
+RUNS = 5
+TARGET = 0.2
+BACKENDS = ['requests', 'helpscout', 'pypd', 'holidays', 'slackclient',
+            'httplib2', 'apiclient.discovery', 'oauth2client.file']
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+def cold(code):
+    times = []
+    for n in range(RUNS):
+        out = subprocess.check_output([sys.executable, '-c', (
+            "import sys; sys.path.insert(0, %r)\n"
+            "from time import time; start = time()\n"
+            "%s\n"
+            "print time() - start") % (ROOT, code)])
+        times.append(float(out.split()[-1]))
+    return sorted(times)[len(times) // 2]
+
+base = cold("import ScoutBot")
+print "import ScoutBot: %4.0fms %s" % (
+    base * 1000, "ok" if base < TARGET else "over %.0fms target" % (
+        TARGET * 1000))
+
+for name in BACKENDS:
+    t = cold("import ScoutBot; import %s" % (name,))
+    print "  + %-20s %4.0fms" % (name, (t - base) * 1000)
@@ -1,2 +1,2 @@
 from ScoutBot import ScoutBot
-print ScoutBot().support_now()
+print ScoutBot(read_only=True).support_now()
@@ -0,0 +1,58 @@
+#!/bin/env python
+# Fills a scratch SLA history with a month of scans (70k rows a day,
+# about 2M in all) and times loading it and the two reports.  Both
+# reports should come back in well under a second.
+import random
+import shutil
+import tempfile
+from time import time
+
+import ScoutBot
+from ScoutBot import SLAHistory, SLA_STATES
+
+DAYS = 30
+SCANS_PER_DAY = 700
+TICKETS_PER_SCAN = 100
+PEOPLE = ['<@U%03d>' % n for n in range(8)]
+
+class Bot:
+    sla_report = ScoutBot.ScoutBot.sla_report.im_func
+    sla_by_person = ScoutBot.ScoutBot.sla_by_person.im_func
+    plain_name = ScoutBot.ScoutBot.plain_name.im_func
+    slack_names = ScoutBot.SlackNameIndex()
+
+path = tempfile.mkdtemp()
+try:
+    bot = Bot()
+    bot.sla_history = history = SLAHistory(path)
+    random.seed(1)
+    now = time()
+    start = time()
+    for day in range(DAYS - 1, -1, -1):
+        at = now - day * 86400
+        rows = []
+        for scan in range(SCANS_PER_DAY):
+            oncall = PEOPLE[scan * len(PEOPLE) // SCANS_PER_DAY]
+            for n in range(TICKETS_PER_SCAN):
+                state = random.choice(SLA_STATES)
+                wait = random.randint(0, 7200) if state in (
+                    'new', 'needs_reply') else 0
+                rows.append((day * 1000 + n, 'default', state, wait, oncall,
+                             min(3, wait // 1200)))
+        history.append(rows, at=at)
+        history.day = None
+    print "wrote %d rows in %.1fs" % (
+        DAYS * SCANS_PER_DAY * TICKETS_PER_SCAN, time() - start)
+
+    for name, run in (("load", lambda: history.load(DAYS, now)),
+                      ("sla report", lambda: bot.sla_report(DAYS)),
+                      ("sla by person", lambda: bot.sla_by_person(DAYS))):
+        start = time()
+        run()
+        print "%-14s %.3fs" % (name, time() - start)
+    print
+    print bot.sla_report(DAYS)
+    print
+    print bot.sla_by_person(DAYS)
+finally:
+    shutil.rmtree(path)
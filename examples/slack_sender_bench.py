@@ -0,0 +1,88 @@
+#!/bin/env python
+# Posts an alert to 6 channels through a local fake Slack that takes
+# 100ms per call, one call after another and then through a
+# SlackSender.  The sender should take about one round-trip, and each
+# channel should get its messages in the order they were sent.
+import BaseHTTPServer
+import SocketServer
+import json
+import threading
+import urlparse
+from time import sleep, time
+
+from ScoutBot import HTTPPool, SlackSender
+
+CHANNELS = ['support-%d' % n for n in range(6)]
+MESSAGES_PER_CHANNEL = 3
+LATENCY = 0.1
+
+received = []
+
+class FakeSlack(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        form = urlparse.parse_qs(
+            self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        sleep(LATENCY)
+        received.append((form['channel'][0], form['text'][0]))
+        body = json.dumps(dict(ok=True))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+server = Server(('127.0.0.1', 0), FakeSlack)
+thread = threading.Thread(target=server.serve_forever)
+thread.daemon = True
+thread.start()
+
+http = HTTPPool()
+url = 'http://127.0.0.1:%d/api/chat.postMessage' % (server.server_port,)
+
+def post(channel, text):
+    return lambda: http.request('post', url,
+                                data=dict(channel=channel, text=text))
+
+def wait_for(sender, count):
+    done = []
+    while len(done) < count:
+        done.extend(sender.finished())
+        sleep(0.001)
+    return done
+
+messages = [(channel, 'alert %d' % n) for n in range(MESSAGES_PER_CHANNEL)
+            for channel in CHANNELS]
+
+start = time()
+for channel, text in messages[:len(CHANNELS)]:
+    post(channel, text)()
+print "one at a time: %d posts in %.2fs" % (len(CHANNELS), time() - start)
+
+del received[:]
+sender = SlackSender()
+start = time()
+for channel, text in messages[:len(CHANNELS)]:
+    sender.send(channel, post(channel, text))
+done = wait_for(sender, len(CHANNELS))
+print "SlackSender:   %d posts in %.2fs, %d failed" % (
+    len(CHANNELS), time() - start, len([d for d in done if d[2]]))
+
+del received[:]
+for channel, text in messages:
+    sender.send(channel, post(channel, text))
+wait_for(sender, len(messages))
+in_order = all([text for c, text in received if c == channel] ==
+               [text for c, text in messages if c == channel]
+               for channel in CHANNELS)
+print "per-channel order kept: %s" % (in_order,)
+
+http.session.close()
+server.shutdown()
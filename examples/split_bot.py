@@ -0,0 +1,8 @@
+#!/bin/env python
+# Like bot.py, but HelpScout polling runs in its own process.
+def load_src(name, fpath):
+    import os, imp
+    return imp.load_source(name, os.path.join(os.path.dirname(__file__), fpath))
+load_src("ScoutBot", "../ScoutBot.py")
+from ScoutBot import ScoutBot
+ScoutBot().slackbot_split()
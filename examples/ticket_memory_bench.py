@@ -0,0 +1,79 @@
+#!/bin/env python
+# Memory held by 10k tickets: the old per-ticket dicts (with the full
+# lowercased last message body) against Ticket records.  Uses
+# tracemalloc where the interpreter has it, and otherwise adds up
+# sys.getsizeof over everything each list refers to.
+import gc
+import random
+import sys
+from datetime import datetime, timedelta
+
+from ScoutBot import Ticket, body_digest, td_format
+
+TICKETS = 10000
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+def body(n):
+    return ("Hi, I'm having trouble with page %d, the import keeps "
+            "failing when I upload my list. " % n) * random.randint(5, 40)
+
+def old_ticket(n, now):
+    wait = timedelta(seconds=random.randint(0, 86400))
+    return dict(owner='', id=100000 + n, num=n, subject='Ticket %d' % n,
+                folder_id=1, mailbox_id=1,
+                url='https://secure.helpscout.net/conversation/%s' % (
+                    100000 + n,),
+                created_at=now, new=False, needs_reply_or_close=True,
+                last_support_msg_at=now, last_client_msg_at=now,
+                last_body=body(n).lower(), wait_time=wait,
+                wait_time_human=td_format(wait))
+
+def new_ticket(n, now):
+    return Ticket(owner=None, id=100000 + n, num=n, subject='Ticket %d' % n,
+                  folder_id=1, mailbox_id=1,
+                  url='https://secure.helpscout.net/conversation/%s' % (
+                      100000 + n,),
+                  created_at=now, new=False, needs_reply_or_close=True,
+                  last_support_msg_at=now, last_client_msg_at=now,
+                  body_digest=body_digest(body(n)),
+                  wait_time=timedelta(seconds=random.randint(0, 86400)))
+
+def deep_size(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen)
+                    for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_size(getattr(obj, name), seen)
+                    for name in obj.__slots__)
+    return size
+
+def measure(make):
+    now = datetime.utcnow()
+    random.seed(1)
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+        tickets = [make(n, now) for n in range(TICKETS)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        tickets = [make(n, now) for n in range(TICKETS)]
+        size = deep_size(tickets, set([id(now)]))
+    return size
+
+print "measuring with %s" % ("tracemalloc" if tracemalloc else
+                             "sys.getsizeof")
+old = measure(old_ticket)
+new = measure(new_ticket)
+print "dicts:   %6.1f MB (%4d bytes/ticket)" % (old / 1e6, old / TICKETS)
+print "Tickets: %6.1f MB (%4d bytes/ticket)" % (new / 1e6, new / TICKETS)
@@ -1,2 +1,2 @@
 from ScoutBot import ScoutBot
-print ScoutBot().support_day()
+print ScoutBot(read_only=True).support_day()
@@ -1,2 +1,2 @@
 from ScoutBot import ScoutBot
-print ScoutBot().support_day(offset=1)
+print ScoutBot(read_only=True).support_day(offset=1)
@@ -33,7 +33,7 @@ setup(
     url=URL,
     license=read_file('LICENSE'),
     namespace_packages=[],
-    packages=[u'ScoutBot'],
+    py_modules=['ScoutBot'],
     package_dir = {'': os.path.dirname(__file__)},
     include_package_data=True,
     zip_safe=False,
@@ -42,6 +42,9 @@ setup(
     ],
     entry_points = {
         # -*- Entry points -*-
+        'console_scripts': [
+            'scoutbot = ScoutBot:main',
+        ],
     },
     classifiers=[
     	# see http://pypi.python.org/pypi?:action=list_classifiers